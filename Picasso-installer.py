@@ -1,18 +1,14 @@
 import sys
-import os
 import math
 from PyQt6.QtWidgets import QComboBox
 from PyQt6 import QtWidgets, QtCore
 from PyQt6.QtCore import QSize, Qt, QRect, QPoint
-from PyQt6.QtGui import QIcon, QAction, QColor, QPixmap, QPainter, QImage, QPen, QShortcut, QKeySequence, QFontDatabase
+from PyQt6.QtGui import QAction, QColor, QPixmap, QPainter, QImage, QPen, QShortcut, QKeySequence, QFontDatabase
 from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QLabel, \
    QGraphicsColorizeEffect, QToolBar, QSlider, QWidget, QVBoxLayout, QHBoxLayout, QFileDialog, QColorDialog
 
-def resource_path(relative_path):
-    if hasattr(sys, '_MEIPASS'):
-        return os.path.join(sys._MEIPASS, relative_path)
-    return os.path.join(os.path.abspath("."), relative_path)
-
+from picasso.floodfill import fill_image
+from picasso.icons import icon
 
 class Canvas(QLabel):
     def __init__(self, main_window):
@@ -31,6 +27,7 @@ class Canvas(QLabel):
         self.pen_color = QColor('#000000')
         self.pen_size = 4
         self.eraser = False
+        self.fill_tolerance = 0
 
         self.temp_end_point = None
 
@@ -61,37 +58,20 @@ class Canvas(QLabel):
             print("❌ Нет pixmap!")
             return
 
-        img = QImage(pixmap.toImage())
+        img = pixmap.toImage().convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
         if not QRect(0, 0, img.width(), img.height()).contains(pos):
             print(f"❌ Позиция вне изображения: {pos}")
             return
 
         target_color = img.pixelColor(pos)
-        if target_color.rgba() == color.rgba():
+        if self.fill_tolerance <= 0 and target_color.rgba() == color.rgba():
             print("🎨 Цвет совпадает, заливка не нужна")
             return
 
-        painter = QPainter(pixmap)
-        painter.setPen(QPen(color))
-
-        stack = [(pos.x(), pos.y())]
-        checked = set()
-
-        while stack:
-            x, y = stack.pop()
-            if (x, y) in checked:
-                continue
-            checked.add((x, y))
-
-            if img.pixelColor(x, y).rgba() == target_color.rgba():
-                painter.drawPoint(x, y)
-                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    nx, ny = x + dx, y + dy
-                    if 0 <= nx < img.width() and 0 <= ny < img.height():
-                        stack.append((nx, ny))
+        if fill_image(img, pos, color, self.fill_tolerance) is None:
+            return
 
-        painter.end()
-        self.setPixmap(pixmap)
+        self.setPixmap(QPixmap.fromImage(img))
         self.save_state()
 
     def clear(self):
@@ -260,9 +240,9 @@ class MainWindow(QMainWindow):
         main_menu = self.menuBar()
         file_menu = main_menu.addMenu("File")
 
-        new_img_action = QAction(QIcon('icons/new-image.png'), 'New', self)
-        open_action = QAction(QIcon('icons/open-image.png'), 'Open', self)
-        save_action = QAction(QIcon('icons/save-image.png'), 'Save', self)
+        new_img_action = QAction(icon('new-image'), 'New', self)
+        open_action = QAction(icon('open-image'), 'Open', self)
+        save_action = QAction(icon('save-image'), 'Save', self)
 
         file_menu.addAction(new_img_action)
         file_menu.addAction(open_action)
@@ -293,11 +273,11 @@ class MainWindow(QMainWindow):
         # Панели инструментов
         self.toolbar = self.addToolBar("Tools")
 
-        self.undo_action = QAction(QIcon("icons/left.png"), "Undo", self)
+        self.undo_action = QAction(icon('left'), "Undo", self)
         self.undo_action.triggered.connect(self.canvas.undo)
         self.toolbar.addAction(self.undo_action)
 
-        self.redo_action = QAction(QIcon("icons/right.png"), "Redo", self)
+        self.redo_action = QAction(icon('right'), "Redo", self)
         self.redo_action.triggered.connect(self.canvas.redo)
         self.toolbar.addAction(self.redo_action)
 
@@ -323,7 +303,7 @@ class MainWindow(QMainWindow):
 
         # Ползунок для изменения размера текста
         sizeicon = QLabel()
-        sizeicon.setPixmap(QPixmap("icons/border-weight.png"))
+        sizeicon.setPixmap(icon('border-weight').pixmap(16, 16))
         self.sliderToolbar.addWidget(sizeicon)
 
         self.sizeselect = QSlider()
@@ -334,22 +314,22 @@ class MainWindow(QMainWindow):
 
         # Кнопки для рисования
         self.brushButton = QPushButton()
-        self.brushButton.setIcon(QIcon('icons/paint-brush.png'))
+        self.brushButton.setIcon(icon('paint-brush'))
         self.brushButton.setCheckable(True)
         self.drawingToolbar.addWidget(self.brushButton)
 
         self.canButton = QPushButton()
-        self.canButton.setIcon(QIcon('icons/paint-can.png'))
+        self.canButton.setIcon(icon('paint-can'))
         self.canButton.setCheckable(True)
         self.drawingToolbar.addWidget(self.canButton)
 
         self.eraserButton = QPushButton()
-        self.eraserButton.setIcon(QIcon('icons/eraser.png'))
+        self.eraserButton.setIcon(icon('eraser'))
         self.eraserButton.setCheckable(True)
         self.drawingToolbar.addWidget(self.eraserButton)
 
         self.pickerButton = QPushButton()
-        self.pickerButton.setIcon(QIcon('icons/pipette.png'))
+        self.pickerButton.setIcon(icon('pipette'))
         self.pickerButton.setCheckable(True)
         self.drawingToolbar.addWidget(self.pickerButton)
         self.pickerButton.clicked.connect(self.picker_pressed)
@@ -375,7 +355,7 @@ class MainWindow(QMainWindow):
 
 
         self.textButton = QPushButton()
-        self.textButton.setIcon(QIcon('icons/text.png'))
+        self.textButton.setIcon(icon('text'))
         self.textButton.setCheckable(True)
         self.drawingToolbar.addWidget(self.textButton)
 
@@ -383,11 +363,11 @@ class MainWindow(QMainWindow):
 
         # ---Выпадающий список фигур---
         self.shapeComboBox = QComboBox()
-        self.shapeComboBox.addItem(QIcon("icons/none.png"), "Нет")
-        self.shapeComboBox.addItem(QIcon("icons/square.png"), "Квадрат")
-        self.shapeComboBox.addItem(QIcon("icons/circle.png"), "Круг")
-        self.shapeComboBox.addItem(QIcon("icons/line.png"), "Линия")
-        self.shapeComboBox.addItem(QIcon("icons/arrow.png"), "Стрелка")
+        self.shapeComboBox.addItem(icon('none'), "Нет")
+        self.shapeComboBox.addItem(icon('square'), "Квадрат")
+        self.shapeComboBox.addItem(icon('circle'), "Круг")
+        self.shapeComboBox.addItem(icon('line'), "Линия")
+        self.shapeComboBox.addItem(icon('arrow'), "Стрелка")
 
         self.drawingToolbar.addWidget(self.shapeComboBox)
 
@@ -396,22 +376,22 @@ class MainWindow(QMainWindow):
 
         # Кнопки управления файлами
         self.newFileButton = QPushButton()
-        self.newFileButton.setIcon(QIcon('icons/new-image.png'))
+        self.newFileButton.setIcon(icon('new-image'))
         self.fileToolbar.addWidget(self.newFileButton)
         new_shortcut = QShortcut(QKeySequence("Ctrl+N"), self)
 
         self.openFileButton = QPushButton()
-        self.openFileButton.setIcon(QIcon('icons/open-image.png'))
+        self.openFileButton.setIcon(icon('open-image'))
         self.fileToolbar.addWidget(self.openFileButton)
         open_shortcut = QShortcut(QKeySequence("Ctrl+O"), self)
 
         self.saveFileButton = QPushButton()
-        self.saveFileButton.setIcon(QIcon('icons/save-image.png'))
+        self.saveFileButton.setIcon(icon('save-image'))
         self.fileToolbar.addWidget(self.saveFileButton)
         save_shortcut = QShortcut(QKeySequence("Ctrl+S"), self)
 
         self.copyFileButton = QPushButton()
-        self.copyFileButton.setIcon(QIcon('icons/copy-image.png'))
+        self.copyFileButton.setIcon(icon('copy-image'))
         self.fileToolbar.addWidget(self.copyFileButton)
 
         self.openFileButton.clicked.connect(self.open_file)
@@ -525,7 +505,7 @@ class MainWindow(QMainWindow):
 
 
 app = QApplication(sys.argv)
-app.setWindowIcon(QIcon('icons/pallete.png'))
+app.setWindowIcon(icon('pallete'))
 window = MainWindow()
 window.show()
 
@@ -0,0 +1,180 @@
+"""Пакетная обработка каталога картинок без окна.
+
+Те же операции, что на холсте: обрезка до 800x500 (как при открытии
+в main.py), заливка, фигуры, текст и сохранение в PNG. Картинки
+обрабатываются в пуле процессов по числу ядер; в каждом процессе —
+свой QGuiApplication на платформе offscreen.
+
+    python batch.py входной_каталог выходной_каталог \\
+        --fill 10,10,#ff0000 --shape arrow,20,20,200,120,#000000,4 \\
+        --text 30,480,"Подпись",#ffffff,24
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+CANVAS_WIDTH, CANVAS_HEIGHT = 800, 500
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp')
+# Картинок на одну передачу в процесс: меньше накладных расходов на IPC
+CHUNK = 8
+
+_app = None
+
+
+def _init_worker():
+    # Qt в процессе-работнике: без окон, только QImage и шрифты
+    global _app
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtGui import QGuiApplication
+    _app = QGuiApplication.instance() or QGuiApplication([sys.argv[0]])
+
+
+def crop_to_canvas(image, width=CANVAS_WIDTH, height=CANVAS_HEIGHT):
+    """Масштабирует картинку так, чтобы она закрыла width x height,
+    и обрезает лишнее поровну с двух сторон."""
+    from PyQt6.QtCore import QRect, Qt
+    iw, ih = image.width(), image.height()
+    if (iw, ih) == (width, height):
+        return image
+    mode = Qt.TransformationMode.SmoothTransformation
+    if iw / width < ih / height:
+        image = image.scaledToWidth(width, mode)
+    elif iw / width > ih / height:
+        image = image.scaledToHeight(height, mode)
+    else:
+        return image.scaled(width, height, transformMode=mode)
+    return image.copy(QRect((image.width() - width) // 2, (image.height() - height) // 2, width, height))
+
+
+def process(job):
+    """Обрабатывает одну картинку; возвращает (путь, ошибка или None)."""
+    source, target, ops = job
+    try:
+        from PyQt6.QtCore import QPoint, Qt
+        from PyQt6.QtGui import QImage, QImageReader, QColor, QPainter, QPen, QFont
+        from picasso.floodfill import fill_image
+        from picasso.saver import write_png
+        from picasso.shapes import Shape
+
+        reader = QImageReader(source)
+        size = reader.size()
+        if ops['crop'] and size.isValid():
+            # Декодер сразу выдаёт картинку размера, закрывающего холст
+            # (JPEG умеет это дёшево), и пересчитывать её не придётся
+            reader.setScaledSize(size.scaled(CANVAS_WIDTH, CANVAS_HEIGHT,
+                                             Qt.AspectRatioMode.KeepAspectRatioByExpanding))
+        image = reader.read()
+        if image.isNull():
+            raise OSError(f"не удалось прочитать {source}: {reader.errorString()}")
+        if ops['crop']:
+            image = crop_to_canvas(image)
+        image = image.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+
+        for x, y, color in ops['fill']:
+            fill_image(image, QPoint(x, y), QColor(color), ops['tolerance'])
+        painter = QPainter(image)
+        for tool, x1, y1, x2, y2, color, width in ops['shapes']:
+            Shape(tool, QPoint(x1, y1), QPoint(x2, y2), QColor(color), width).draw(painter)
+        for x, y, text, color, size in ops['text']:
+            font = QFont()
+            font.setPointSize(size)
+            painter.setFont(font)
+            painter.setPen(QPen(QColor(color)))
+            painter.drawText(QPoint(x, y), text)
+        painter.end()
+        write_png(image, target, ops['compression'])
+        return source, None
+    except Exception as e:
+        return source, str(e)
+
+
+def output_names(names):
+    """Имена PNG для картинок names: имя без расширения, а если оно общее
+    у нескольких картинок (a.jpg и a.png) — с расширением (a.jpg.png).
+    Возвращает {имя картинки: имя PNG или None, если имя всё равно занято}.
+    Регистр не различается: в Windows и macOS A.png и a.png — один файл."""
+    stems = Counter(os.path.splitext(name)[0].lower() for name in names)
+    result = {}
+    for name in names:
+        stem = os.path.splitext(name)[0]
+        result[name] = (stem if stems[stem.lower()] == 1 else name) + '.png'
+    # Имя с расширением может совпасть с обычным (a.jpg.png от a.jpg.gif)
+    taken = Counter(target.lower() for target in result.values())
+    return {name: target if taken[target.lower()] == 1 else None for name, target in result.items()}
+
+
+def _fields(kinds):
+    # Разбор "a,b,c" в кортеж по типам kinds
+    def parse(value):
+        parts = value.split(',')
+        if len(parts) != len(kinds):
+            raise argparse.ArgumentTypeError(f"ожидалось {len(kinds)} значений через запятую: {value}")
+        return tuple(kind(part) for kind, part in zip(kinds, parts))
+    return parse
+
+
+def _text_field(value):
+    # x,y,текст,цвет,размер — в тексте могут быть запятые
+    x, y, rest = value.split(',', 2)
+    text, color, size = rest.rsplit(',', 2)
+    return int(x), int(y), text, color, int(size)
+
+
+def main(argv=None):
+    from picasso.saver import DEFAULT_COMPRESSION
+    from picasso.shapes import SHAPES
+
+    parser = argparse.ArgumentParser(description="Пакетная обработка картинок Picasso")
+    parser.add_argument('input', help="каталог с картинками")
+    parser.add_argument('output', help="каталог для PNG")
+    parser.add_argument('--fill', action='append', default=[], type=_fields((int, int, str)),
+                        metavar='X,Y,ЦВЕТ', help="заливка из точки")
+    parser.add_argument('--shape', action='append', default=[],
+                        type=_fields((str, int, int, int, int, str, int)),
+                        metavar='ФИГУРА,X1,Y1,X2,Y2,ЦВЕТ,ТОЛЩИНА', help=f"фигура: {', '.join(SHAPES)}")
+    parser.add_argument('--text', action='append', default=[], type=_text_field,
+                        metavar='X,Y,ТЕКСТ,ЦВЕТ,РАЗМЕР', help="надпись")
+    parser.add_argument('--tolerance', type=int, default=0, help="допуск заливки")
+    parser.add_argument('--no-crop', dest='crop', action='store_false',
+                        help=f"не обрезать до {CANVAS_WIDTH}x{CANVAS_HEIGHT}")
+    parser.add_argument('--compression', type=int, default=DEFAULT_COMPRESSION, help="сжатие PNG, 0–9")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="число процессов")
+    args = parser.parse_args(argv)
+
+    for shape in args.shape:
+        if shape[0] not in SHAPES:
+            parser.error(f"неизвестная фигура {shape[0]}")
+    ops = {'crop': args.crop, 'fill': args.fill, 'shapes': args.shape, 'text': args.text,
+           'tolerance': args.tolerance, 'compression': args.compression}
+
+    os.makedirs(args.output, exist_ok=True)
+    names = [name for name in sorted(os.listdir(args.input)) if name.lower().endswith(IMAGE_EXTENSIONS)]
+    jobs = []
+    failed = 0
+    for name, target in output_names(names).items():
+        source = os.path.join(args.input, name)
+        if target is None:
+            failed += 1
+            print(f"❌ {source}: имя результата совпадает с другой картинкой", file=sys.stderr)
+            continue
+        if os.path.splitext(target)[0] == name:
+            print(f"⚠ {source}: другая картинка с тем же именем, результат — {target}")
+        jobs.append((source, os.path.join(args.output, target), ops))
+
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        for source, error in pool.map(process, jobs, chunksize=CHUNK):
+            if error is not None:
+                failed += 1
+                print(f"❌ {source}: {error}", file=sys.stderr)
+    elapsed = time.monotonic() - start
+    print(f"Готово: {len(names) - failed} из {len(names)} за {elapsed:.1f} с")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
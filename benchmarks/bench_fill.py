@@ -0,0 +1,97 @@
+"""Сравнение скорости заливки: старый попиксельный цикл, scanline и NumPy.
+
+Запуск: python benchmarks/bench_fill.py [ширина высота ...]
+"""
+
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PyQt6.QtCore import QPoint
+from PyQt6.QtGui import QGuiApplication, QImage, QColor, QPainter, QPen
+
+from picasso import floodfill
+
+# Старый цикл слишком медленный для больших картинок
+LEGACY_LIMIT = 800 * 500
+
+
+def legacy_fill(img, pos, color):
+    # Алгоритм из прежней версии Canvas.fill_color
+    target_color = img.pixelColor(pos)
+    painter = QPainter(img)
+    painter.setPen(QPen(color))
+    stack = [(pos.x(), pos.y())]
+    checked = set()
+    while stack:
+        x, y = stack.pop()
+        if (x, y) in checked:
+            continue
+        checked.add((x, y))
+        if img.pixelColor(x, y).rgba() == target_color.rgba():
+            painter.drawPoint(x, y)
+            for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < img.width() and 0 <= ny < img.height():
+                    stack.append((nx, ny))
+    painter.end()
+
+
+def make_images(w, h):
+    blank = QImage(w, h, QImage.Format.Format_ARGB32_Premultiplied)
+    blank.fill(QColor("white"))
+
+    # «Скан»: белый фон с множеством мелких фигур
+    rnd = random.Random(0)
+    noisy = blank.copy()
+    painter = QPainter(noisy)
+    for _ in range(w * h // 1500):
+        painter.drawEllipse(rnd.randrange(w), rnd.randrange(h),
+                            rnd.randrange(1, 40), rnd.randrange(1, 40))
+    painter.end()
+    return [("пустой холст", blank), ("шумный скан", noisy)]
+
+
+def measure(fn, img):
+    img = img.copy()
+    start = time.perf_counter()
+    fn(img)
+    return (time.perf_counter() - start) * 1000, img
+
+
+def main():
+    app = QGuiApplication(sys.argv)
+    args = [int(a) for a in sys.argv[1:]] or [800, 500, 4000, 3000]
+    sizes = list(zip(args[::2], args[1::2]))
+
+    pos, color = QPoint(0, 0), QColor("red")
+    backends = [("scanline", lambda img: floodfill.fill_image(img, pos, color, backend="scanline"))]
+    if floodfill.HAVE_NUMPY:
+        backends.append(("numpy", lambda img: floodfill.fill_image(img, pos, color, backend="numpy")))
+    else:
+        print("NumPy не установлен, вариант numpy пропущен")
+
+    print(f"{'размер':>11} {'картинка':>14} {'legacy':>10}" + "".join(f" {n:>10}" for n, _ in backends))
+    for w, h in sizes:
+        for name, img in make_images(w, h):
+            row = f"{w:>5}x{h:<5} {name:>14}"
+            reference = None
+            if w * h <= LEGACY_LIMIT:
+                ms, reference = measure(lambda i: legacy_fill(i, pos, color), img)
+                row += f" {ms:>8.1f}ms"
+            else:
+                row += f" {'—':>10}"
+            for _, fn in backends:
+                ms, result = measure(fn, img)
+                row += f" {ms:>8.1f}ms"
+                if reference is not None and result != reference:
+                    row += " (!)"
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""Ядро Picasso: операции над изображением без окон.
+
+Заливка, фигуры и геометрия стрелок, плитки, слои, история отмены,
+журнал и проекты. Модули грузятся по первому обращению
+(picasso.floodfill, picasso.shapes, ...), поэтому `import picasso`
+ничего не тянет, а пакетным инструментам и проверкам не нужен
+QtWidgets — только QtCore и QtGui.
+"""
+
+import importlib
+
+__all__ = ['filters', 'floodfill', 'fonts', 'history', 'icons', 'journal', 'layers', 'loader', 'mipmap',
+           'project', 'saver', 'selection', 'shapes', 'stroke', 'tiles']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,238 @@
+"""Фильтры изображения на NumPy: размытие, резкость, яркость/контраст,
+уровни, оттенки серого, инверсия.
+
+Фильтр работает с массивом-представлением битов QImage (без копии)
+формы (высота, ширина, 4). Свёртки раздельные: сначала по строкам,
+потом по столбцам. Большое изображение обрабатывается полосами
+с запасом по краям, поэтому работу можно прервать между полосами.
+"""
+
+import sys
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QSize, Qt, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from .floodfill import HAVE_NUMPY, load_numpy
+
+# Модуль NumPy; загружается в view() — все фильтры начинаются с него
+np = None
+
+# Фильтры работают с непремультиплицированными пикселями
+FORMAT = QImage.Format.Format_ARGB32
+# Высота полосы при обработке в фоне
+BAND = 256
+# Большая сторона уменьшенной копии для предпросмотра
+PREVIEW_SIDE = 400
+
+
+def view(image):
+    """Массив (высота, ширина, 4) поверх битов image; каналы B, G, R, A
+    (на little-endian). Запись в массив меняет image."""
+    global np
+    np = load_numpy()
+    bits = image.bits()
+    bits.setsize(image.sizeInBytes())
+    arr = np.frombuffer(memoryview(bits), dtype=np.uint8)
+    return arr.reshape(image.height(), image.bytesPerLine() // 4, 4)[:, :image.width()]
+
+
+# Индексы каналов в байтах пикселя
+R, G, B, A = (2, 1, 0, 3) if sys.byteorder == "little" else (1, 2, 3, 0)
+RGB = [R, G, B]
+
+
+def _kernel(radius):
+    sigma = max(radius / 2, 0.5)
+    x = np.arange(-radius, radius + 1, dtype=np.float32)
+    k = np.exp(-x * x / (2 * sigma * sigma))
+    return k / k.sum()
+
+
+def _convolve(arr, kernel, axis):
+    # Одномерная свёртка вдоль axis с повтором крайних пикселей
+    r = len(kernel) // 2
+    pad = [(0, 0)] * arr.ndim
+    pad[axis] = (r, r)
+    padded = np.pad(arr, pad, mode='edge')
+    out = np.zeros_like(arr)
+    n = arr.shape[axis]
+    window = [slice(None)] * arr.ndim
+    for i, weight in enumerate(kernel):
+        window[axis] = slice(i, i + n)
+        out += weight * padded[tuple(window)]
+    return out
+
+
+def _gaussian(arr, radius):
+    # Премультипликация на время свёртки, чтобы прозрачные пиксели
+    # не тянули цвет к чёрному
+    data = arr.astype(np.float32)
+    data[..., RGB] *= data[..., A:A + 1] / 255
+    kernel = _kernel(radius)
+    data = _convolve(_convolve(data, kernel, 1), kernel, 0)
+    data[..., RGB] /= np.maximum(data[..., A:A + 1] / 255, 1 / 255)
+    return data
+
+
+def blur(arr, radius=3):
+    arr[:] = np.clip(_gaussian(arr, radius) + 0.5, 0, 255).astype(np.uint8)
+
+
+def sharpen(arr, amount=50, radius=1):
+    # Нерезкая маска: исходное плюс amount% разницы с размытым
+    data = arr.astype(np.float32)
+    blurred = _gaussian(arr, radius)
+    data[..., RGB] += amount / 100 * (data[..., RGB] - blurred[..., RGB])
+    arr[:] = np.clip(data + 0.5, 0, 255).astype(np.uint8)
+
+
+def _apply_lut(arr, lut):
+    for c in RGB:
+        arr[..., c] = lut[arr[..., c]]
+
+
+def brightness_contrast(arr, brightness=0, contrast=0):
+    v = np.arange(256, dtype=np.float32)
+    v = (v - 128) * (1 + contrast / 100) + 128 + brightness * 255 / 100
+    _apply_lut(arr, np.clip(v + 0.5, 0, 255).astype(np.uint8))
+
+
+def levels(arr, black=0, white=255, gamma=100):
+    # gamma — в сотых: 100 означает 1.0
+    v = np.arange(256, dtype=np.float32)
+    v = np.clip((v - black) / max(white - black, 1), 0, 1) ** (100 / max(gamma, 1))
+    _apply_lut(arr, np.clip(v * 255 + 0.5, 0, 255).astype(np.uint8))
+
+
+def grayscale(arr):
+    y = 0.299 * arr[..., R] + 0.587 * arr[..., G] + 0.114 * arr[..., B]
+    y = np.clip(y + 0.5, 0, 255).astype(np.uint8)
+    for c in RGB:
+        arr[..., c] = y
+
+
+def invert(arr):
+    for c in RGB:
+        np.subtract(255, arr[..., c], out=arr[..., c])
+
+
+class Param:
+    """Параметр фильтра для диалога; spatial — величина в пикселях
+    (для предпросмотра на уменьшенной копии она уменьшается)."""
+
+    def __init__(self, name, label, minimum, maximum, default, spatial=False):
+        self.name = name
+        self.label = label
+        self.minimum = minimum
+        self.maximum = maximum
+        self.default = default
+        self.spatial = spatial
+
+
+class Filter:
+    def __init__(self, title, function, params=(), margin=None):
+        self.title = title
+        self.function = function
+        self.params = list(params)
+        # margin(params) — сколько пикселей соседних полос нужно свёртке
+        self.margin = margin or (lambda params: 0)
+
+    def scaled(self, params, scale):
+        return {p.name: max(1, round(params[p.name] * scale)) if p.spatial else params[p.name]
+                for p in self.params}
+
+    def apply(self, image, params, scale=1.0, cancelled=None, progress=None):
+        """Фильтрует копию image; None, если работу отменили."""
+        params = self.scaled(params, scale)
+        source = image.convertToFormat(FORMAT)
+        result = source.copy()
+        src, dst = view(source), view(result)
+        margin = self.margin(params)
+        h = image.height()
+        for top in range(0, h, BAND):
+            if cancelled is not None and cancelled():
+                return None
+            bottom = min(h, top + BAND)
+            lo, hi = max(0, top - margin), min(h, bottom + margin)
+            band = src[lo:hi].copy()
+            self.function(band, **params)
+            dst[top:bottom] = band[top - lo:top - lo + bottom - top]
+            if progress is not None:
+                progress(100 * bottom // h)
+        return result.convertToFormat(image.format())
+
+
+FILTERS = [
+    Filter("Размытие", blur, [Param('radius', "Радиус", 1, 50, 3, spatial=True)],
+           margin=lambda p: p['radius']),
+    Filter("Резкость", sharpen, [Param('amount', "Сила, %", 0, 300, 50),
+                                 Param('radius', "Радиус", 1, 10, 1, spatial=True)],
+           margin=lambda p: p['radius']),
+    Filter("Яркость и контраст", brightness_contrast, [Param('brightness', "Яркость", -100, 100, 0),
+                                                       Param('contrast', "Контраст", -100, 100, 0)]),
+    Filter("Уровни", levels, [Param('black', "Чёрная точка", 0, 254, 0),
+                              Param('white', "Белая точка", 1, 255, 255),
+                              Param('gamma', "Гамма, %", 10, 400, 100)]),
+    Filter("Оттенки серого", grayscale),
+    Filter("Инверсия", invert),
+]
+
+
+def preview_proxy(image, side=PREVIEW_SIDE):
+    """Уменьшенная копия для предпросмотра и её масштаб."""
+    if max(image.width(), image.height()) <= side:
+        return image, 1.0
+    proxy = image.scaled(QSize(side, side), Qt.AspectRatioMode.KeepAspectRatio,
+                         Qt.TransformationMode.SmoothTransformation)
+    return proxy, proxy.width() / image.width()
+
+
+class FilterRunner(QObject):
+    """Применяет фильтр к изображению в пуле потоков, с прогрессом и отменой.
+
+    Сигналы приходят в поток, где живёт объект (очередью).
+    finished испускается всегда — после done, failed или отмены.
+    """
+
+    progress = pyqtSignal(int)
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, filter, image, params, parent=None):
+        super().__init__(parent)
+        self.filter = filter
+        self.image = image
+        self.params = dict(params)
+        self._cancelled = threading.Event()
+
+    def start(self, pool=None):
+        (pool or QThreadPool.globalInstance()).start(_FilterTask(self))
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def run(self):
+        try:
+            result = self.filter.apply(self.image, self.params, cancelled=self.cancelled,
+                                       progress=self.progress.emit)
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            if result is not None and not self.cancelled():
+                self.done.emit(result)
+        finally:
+            self.finished.emit()
+
+
+class _FilterTask(QRunnable):
+    def __init__(self, runner):
+        super().__init__()
+        self.runner = runner
+
+    def run(self):
+        self.runner.run()
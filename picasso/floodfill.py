@@ -0,0 +1,391 @@
+"""Заливка областей по сырому 32-битному буферу изображения.
+
+Построчный (scanline) движок на чистом Python и необязательный NumPy-вариант.
+"""
+
+import importlib.util
+
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QImage
+
+from .tiles import TILE
+
+# NumPy загружается при первом обращении: его импорт заметно
+# удлиняет запуск, а нужен он только заливке и фильтрам
+HAVE_NUMPY = importlib.util.find_spec('numpy') is not None
+np = None
+
+
+def load_numpy():
+    """Импортирует NumPy при первом вызове; None, если он не установлен."""
+    global np
+    if np is None and HAVE_NUMPY:
+        import numpy
+        np = numpy
+    return np
+
+
+def _run_end_exact(src, ro, x, width, pattern):
+    # Первый пиксель справа от x (включительно), не совпадающий с целевым.
+    # Сравниваем срезами с удвоением шага, чтобы работа шла на стороне C.
+    step = 1
+    while x < width:
+        n = min(step, width - x)
+        if src[ro + 4 * x:ro + 4 * (x + n)] == pattern[:4 * n]:
+            x += n
+            step <<= 1
+        elif n == 1:
+            return x
+        else:
+            step = 1
+    return x
+
+
+def _run_start_exact(src, ro, x, pattern):
+    # Первый пиксель совпадающего отрезка, который заканчивается на x.
+    step = 1
+    while x > 0:
+        n = min(step, x)
+        if src[ro + 4 * (x - n):ro + 4 * x] == pattern[:4 * n]:
+            x -= n
+            step <<= 1
+        elif n == 1:
+            return x
+        else:
+            step = 1
+    return x
+
+
+def _next_match_exact(src, ro, x, limit, target):
+    # Первый совпадающий пиксель в [x, limit) или -1.
+    start, stop = ro + 4 * x, ro + 4 * limit
+    while start < stop:
+        pos = src.find(target, start, stop)
+        if pos < 0:
+            return -1
+        if (pos - ro) % 4 == 0:
+            return (pos - ro) // 4
+        start = pos + 1
+    return -1
+
+
+def _near(src, off, target, tolerance):
+    return (abs(src[off] - target[0]) <= tolerance
+            and abs(src[off + 1] - target[1]) <= tolerance
+            and abs(src[off + 2] - target[2]) <= tolerance
+            and abs(src[off + 3] - target[3]) <= tolerance)
+
+
+# Сколько плиток вокруг плитки с точкой заливки копируется сначала
+# (см. _in_window)
+WINDOW_MARGIN = 2
+# Отметки visited (0 или 1) -> значения маски Alpha8
+_MASK_TABLE = bytes([0, 255]) + bytes(254)
+
+
+def scanline_fill(buf, width, height, stride, x, y, fill, tolerance=0):
+    """Заливает связную область вокруг (x, y) значением fill (4 байта пикселя).
+
+    buf — записываемый буфер 32-битных пикселей, stride — длина строки в байтах.
+    Пиксель входит в область, если каждый его канал отличается от цвета
+    в точке (x, y) не больше чем на tolerance. Возвращает QRect изменённой
+    области или None, если заливать нечего.
+    """
+    target = bytes(memoryview(buf).cast('B')[y * stride + 4 * x:y * stride + 4 * x + 4])
+    if tolerance <= 0 and target == fill:
+        return None
+    return _scanline(buf, width, height, stride, x, y, fill, tolerance)[0]
+
+
+def _scanline(buf, width, height, stride, x, y, fill, tolerance):
+    # Обход области отрезками; возвращает (QRect, visited), где visited —
+    # по байту на пиксель изображения, 1 — пиксель в области. При fill=None
+    # буфер не меняется, а нужна только маска
+    mv = memoryview(buf).cast('B')
+    src = bytes(mv)
+    target = src[y * stride + 4 * x:y * stride + 4 * x + 4]
+
+    pattern = target * width
+    fill_row = None if fill is None else fill * width
+    ones = b'\x01' * width
+    visited = bytearray(width * height)
+
+    if tolerance <= 0:
+        def run_end(ro, i):
+            return _run_end_exact(src, ro, i, width, pattern)
+
+        def run_start(ro, i):
+            return _run_start_exact(src, ro, i, pattern)
+
+        def next_match(ro, i, limit):
+            return _next_match_exact(src, ro, i, limit, target)
+    else:
+        def run_end(ro, i):
+            while i < width and _near(src, ro + 4 * i, target, tolerance):
+                i += 1
+            return i
+
+        def run_start(ro, i):
+            while i > 0 and _near(src, ro + 4 * (i - 1), target, tolerance):
+                i -= 1
+            return i
+
+        def next_match(ro, i, limit):
+            while i < limit:
+                if _near(src, ro + 4 * i, target, tolerance):
+                    return i
+                i += 1
+            return -1
+
+    left, top, right, bottom = x, y, x, y
+    stack = [(x, y)]
+    while stack:
+        sx, sy = stack.pop()
+        vo = sy * width
+        if visited[vo + sx]:
+            continue
+        ro = sy * stride
+        l, r = run_start(ro, sx), run_end(ro, sx)
+
+        # Весь отрезок закрашивается и помечается одной операцией
+        if fill_row is not None:
+            mv[ro + 4 * l:ro + 4 * r] = fill_row[:4 * (r - l)]
+        visited[vo + l:vo + r] = ones[:r - l]
+
+        left, right = min(left, l), max(right, r - 1)
+        top, bottom = min(top, sy), max(bottom, sy)
+
+        for ny in (sy - 1, sy + 1):
+            if not 0 <= ny < height:
+                continue
+            nro, nvo = ny * stride, ny * width
+            i = l
+            while i < r:
+                i = next_match(nro, i, r)
+                if i < 0:
+                    break
+                if not visited[nvo + i]:
+                    stack.append((i, ny))
+                i = run_end(nro, i)
+
+    return QRect(left, top, right - left + 1, bottom - top + 1), visited
+
+
+def _region_runs(mask, x, y):
+    # Разбиваем маску на горизонтальные отрезки и находим компоненту
+    # связности, содержащую (x, y), обходом графа отрезков (а не пикселей).
+    h, w = mask.shape
+    padded = np.zeros((h, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    # Соседние отрезки в следующей строке ищем одним searchsorted по ключу
+    # «строка * (w + 1) + колонка», отсортированному так же, как отрезки.
+    span = w + 1
+    start_keys = rows * span + starts
+    end_keys = rows * span + ends
+    lo = np.searchsorted(end_keys, (rows + 1) * span + starts, side='right')
+    hi = np.searchsorted(start_keys, (rows + 1) * span + ends, side='left')
+    counts = np.maximum(hi - lo, 0)
+    a = np.repeat(np.arange(len(rows)), counts)
+    b = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+
+    # Неориентированный граф отрезков в виде CSR
+    src = np.concatenate([a, b])
+    dst = np.concatenate([b, a])
+    order = np.argsort(src, kind='stable')
+    neighbours = dst[order].tolist()
+    offsets = np.searchsorted(src[order], np.arange(len(rows) + 1)).tolist()
+
+    seed = int(np.searchsorted(start_keys, y * span + x, side='right')) - 1
+    label = bytearray(len(rows))
+    label[seed] = 1
+    queue = [seed]
+    for k in queue:
+        for n in neighbours[offsets[k]:offsets[k + 1]]:
+            if not label[n]:
+                label[n] = 1
+                queue.append(n)
+
+    picked = np.frombuffer(bytes(label), dtype=bool)
+    return rows[picked], starts[picked], ends[picked]
+
+
+def numpy_fill(img, pos, color, tolerance=0):
+    """Заливка через NumPy по массиву-представлению битов QImage (без копии).
+
+    Маска цвета строится одним векторным сравнением, а область —
+    разметкой связных горизонтальных отрезков маски.
+    """
+    if not QRect(0, 0, img.width(), img.height()).contains(pos):
+        return None
+    load_numpy()
+    w, h, x, y = img.width(), img.height(), pos.x(), pos.y()
+    bits = img.bits()
+    bits.setsize(img.sizeInBytes())
+    arr = np.frombuffer(memoryview(bits), dtype=np.uint32)
+    arr = arr.reshape(h, img.bytesPerLine() // 4)[:, :w]
+
+    fill = np.frombuffer(pixel_bytes(color, img.format()), dtype=np.uint32)[0]
+    target = arr[y, x]
+    if tolerance <= 0:
+        if target == fill:
+            return None
+        mask = arr == target
+    else:
+        channels = arr.view(np.uint8).reshape(h, w, 4).astype(np.int16)
+        diff = np.abs(channels - channels[y, x])
+        mask = diff.max(axis=2) <= tolerance
+
+    rows, starts, ends = _region_runs(mask, x, y)
+    # Отрезки в строке не пересекаются и не соприкасаются, поэтому
+    # границы можно расставить простым присваиванием, а маску — cumsum
+    region = np.zeros((h, w + 1), dtype=np.int8)
+    region[rows, starts] = 1
+    region[rows, ends] = -1
+    arr[np.cumsum(region, axis=1, dtype=np.int8)[:, :w].view(bool)] = fill
+
+    left, right = int(starts.min()), int(ends.max())
+    top, bottom = int(rows.min()), int(rows.max())
+    return QRect(left, top, right - left, bottom - top + 1)
+
+
+def region_mask(img, pos, tolerance=0, backend=None):
+    """Маска области, которую залила бы заливка из pos: (QImage Alpha8, QRect).
+
+    Маска — только в пределах прямоугольника области (255 — пиксель
+    в области). img не меняется. None, если pos вне изображения.
+    """
+    if not QRect(0, 0, img.width(), img.height()).contains(pos):
+        return None
+    if backend is None:
+        backend = "numpy" if HAVE_NUMPY else "scanline"
+    w, h, x, y = img.width(), img.height(), pos.x(), pos.y()
+    if backend == "numpy":
+        load_numpy()
+        bits = img.constBits()
+        bits.setsize(img.sizeInBytes())
+        arr = np.frombuffer(memoryview(bits), dtype=np.uint32)
+        arr = arr.reshape(h, img.bytesPerLine() // 4)[:, :w]
+        if tolerance <= 0:
+            mask = arr == arr[y, x]
+        else:
+            channels = arr.view(np.uint8).reshape(h, w, 4).astype(np.int16)
+            mask = np.abs(channels - channels[y, x]).max(axis=2) <= tolerance
+        rows, starts, ends = _region_runs(mask, x, y)
+        left, right = int(starts.min()), int(ends.max())
+        top, bottom = int(rows.min()), int(rows.max())
+        region = np.zeros((bottom - top + 1, right - left + 1), dtype=np.int8)
+        region[rows - top, starts - left] = 1
+        region[rows - top, ends - left] = -1
+        out = np.cumsum(region, axis=1, dtype=np.int8)[:, :-1].view(np.uint8) * np.uint8(255)
+        rect = QRect(left, top, right - left, bottom - top + 1)
+        mask = QImage(out.tobytes(), rect.width(), rect.height(), rect.width(),
+                      QImage.Format.Format_Alpha8).copy()
+        return mask, rect
+
+    # Без NumPy: обход отрезками помечает пиксели области в visited,
+    # и маска вырезается из него построчно
+    bits = img.constBits()
+    bits.setsize(img.sizeInBytes())
+    rect, visited = _scanline(bits, w, h, img.bytesPerLine(), x, y, None, tolerance)
+    left, right = rect.left(), rect.right() + 1
+    rows = [visited[row * w + left:row * w + right] for row in range(rect.top(), rect.bottom() + 1)]
+    out = b''.join(rows).translate(_MASK_TABLE)
+    mask = QImage(out, rect.width(), rect.height(), rect.width(), QImage.Format.Format_Alpha8)
+    return mask.copy(), rect
+
+
+def pixel_bytes(color, fmt):
+    # Представление цвета в байтах пикселя заданного формата
+    # (с учётом премультипликации и порядка байт).
+    px = QImage(1, 1, fmt)
+    px.fill(color)
+    return px.constBits().asstring(4)
+
+
+def fill_image(img, pos, color, tolerance=0, backend=None):
+    """Заливка QImage (32 бита на пиксель) на месте; возвращает QRect или None.
+
+    backend: "numpy", "scanline" или None — NumPy, если он установлен.
+    """
+    if backend is None:
+        backend = "numpy" if HAVE_NUMPY else "scanline"
+    if backend == "numpy":
+        return numpy_fill(img, pos, color, tolerance)
+    if not QRect(0, 0, img.width(), img.height()).contains(pos):
+        return None
+    bits = img.bits()
+    bits.setsize(img.sizeInBytes())
+    return scanline_fill(bits, img.width(), img.height(), img.bytesPerLine(),
+                         pos.x(), pos.y(), pixel_bytes(color, img.format()),
+                         tolerance)
+
+
+def _in_window(tiles, pos, find):
+    """Ищет область из pos сначала в окне плиток вокруг неё.
+
+    find(img, точка в img) возвращает None или (значение, QRect области
+    в img). Если область упирается в край окна, не совпадающий с краем
+    изображения, она может продолжаться за ним, и поиск повторяется по
+    всему изображению: небольшая область не требует копии всего слоя,
+    а большая стоит лишь одного лишнего прохода по окну. Итог —
+    (значение, QRect области в изображении, левый верхний угол окна)
+    или None.
+    """
+    bounds = tiles.rect()
+    margin = WINDOW_MARGIN * TILE
+    window = tiles.tile_rect((pos.x() // TILE, pos.y() // TILE))
+    window = window.adjusted(-margin, -margin, margin, margin).intersected(bounds)
+    while True:
+        img = tiles.copy(window)
+        found = find(img, pos - window.topLeft())
+        if found is None:
+            return None
+        value, rect = found
+        rect = rect.translated(window.topLeft())
+        if not (rect.left() == window.left() > bounds.left()
+                or rect.top() == window.top() > bounds.top()
+                or rect.right() == window.right() < bounds.right()
+                or rect.bottom() == window.bottom() < bounds.bottom()):
+            return value, rect, window.topLeft()
+        window = bounds
+
+
+def wand_mask(tiles, pos, tolerance=0):
+    """region_mask для плиточного изображения: (маска, QRect в изображении) или None."""
+    if not tiles.rect().contains(pos):
+        return None
+    result = _in_window(tiles, pos, lambda img, p: region_mask(img, p, tolerance))
+    return None if result is None else result[:2]
+
+
+def fill_tiles(tiles, pos, color, tolerance=0, area=None):
+    """Заливка плиточного изображения из pos; возвращает QRect или None.
+
+    Заливке нужен сплошной буфер: он собирается из плиток вокруг pos
+    (см. _in_window), а обратно записывается только прямоугольник
+    залитой области. С выделением area буфер — только его прямоугольник,
+    а записываются лишь пиксели внутри маски.
+    """
+    if area is not None:
+        origin = area.bounds.topLeft()
+        img = tiles.copy(area.bounds)
+        if fill_image(img, pos - origin, color, tolerance) is None:
+            return None
+        return area.apply(tiles, img, origin)
+    if not tiles.rect().contains(pos):
+        return None
+
+    def fill(img, p):
+        rect = fill_image(img, p, color, tolerance)
+        return None if rect is None else (img, rect)
+
+    result = _in_window(tiles, pos, fill)
+    if result is None:
+        return None
+    img, rect, origin = result
+    tiles.write(img, origin, rect)
+    return rect
@@ -0,0 +1,66 @@
+"""Список семейств шрифтов с кэшем на диске.
+
+На машинах с тысячами шрифтов перебор всех семейств занимает сотни
+миллисекунд, поэтому список сохраняется между запусками и строится
+заново, только когда меняются каталоги шрифтов.
+"""
+
+import json
+import os
+import sys
+
+from PyQt6.QtCore import QStandardPaths
+from PyQt6.QtGui import QFontDatabase
+
+FONT_CACHE = os.path.join(os.path.expanduser('~'), '.picasso', 'fonts.json')
+
+
+def font_dirs():
+    # Системные и пользовательские каталоги шрифтов этой платформы
+    dirs = QStandardPaths.standardLocations(QStandardPaths.StandardLocation.FontsLocation)
+    home = os.path.expanduser('~')
+    if sys.platform == 'win32':
+        dirs += [os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts'),
+                 os.path.join(os.environ.get('LOCALAPPDATA', home), 'Microsoft', 'Windows', 'Fonts')]
+    elif sys.platform == 'darwin':
+        dirs += ['/System/Library/Fonts', '/Library/Fonts', os.path.join(home, 'Library', 'Fonts')]
+    else:
+        dirs += ['/usr/share/fonts', '/usr/local/share/fonts',
+                 os.path.join(home, '.fonts'), os.path.join(home, '.local', 'share', 'fonts')]
+    return sorted({d for d in dirs if os.path.isdir(d)})
+
+
+def signature():
+    """Время изменения всех каталогов шрифтов: меняется при установке
+    и удалении шрифта, а сами файлы не читаются."""
+    result = []
+    for root in font_dirs():
+        for path, dirs, files in os.walk(root):
+            try:
+                result.append([path, os.stat(path).st_mtime_ns])
+            except OSError:
+                pass
+    return result
+
+
+def families(cache_path=FONT_CACHE):
+    """Семейства шрифтов: из кэша, если каталоги шрифтов не менялись."""
+    current = signature()
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data['signature'] == current:
+            return data['families']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    result = QFontDatabase.families()
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = cache_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'signature': current, 'families': result}, f, ensure_ascii=False)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"⚠ Не удалось сохранить список шрифтов: {e}")
+    return result
@@ -0,0 +1,254 @@
+"""История отмены на дельтах: шаг хранит только плитки, изменённые операцией.
+
+Свежие шаги лежат в памяти как есть, старые сжимаются zlib в фоновом
+потоке, а всё, что не влезает в бюджет памяти, выгружается во временный
+файл и читается обратно через mmap.
+"""
+
+import mmap
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt6.QtGui import QImage
+
+# Сколько последних шагов в каждую сторону держать несжатыми
+HOT_STEPS = 4
+# Файл выгрузки перезаписывается, когда мусора в нём больше, чем данных
+SPILL_COMPACT_BYTES = 64 * 1024 * 1024
+
+
+class Patch:
+    """Плитка одного шага: несжатая, сжатая, выгруженная на диск
+    или лежащая блоком в файле проекта (chunk).
+
+    image=None означает, что плитки не было (сплошной фон).
+    """
+
+    __slots__ = ('key', 'image', 'data', 'span', 'future', 'shape', 'chunk')
+
+    def __init__(self, key, image):
+        self.key = key
+        self.image = image
+        self.data = None
+        self.span = None
+        self.future = None
+        self.chunk = None
+        self.shape = None if image is None else \
+            (image.width(), image.height(), image.bytesPerLine(), image.format())
+
+    @classmethod
+    def from_chunk(cls, key, chunk, shape):
+        # Плитка из файла проекта: сжатые данные читаются только при load()
+        patch = cls(key, None)
+        patch.chunk = chunk
+        patch.shape = shape
+        return patch
+
+    def stored(self):
+        return self.shape is not None
+
+    def nbytes(self):
+        if self.image is not None:
+            return self.image.sizeInBytes()
+        return len(self.data) if self.data is not None else 0
+
+    def payload(self, spill):
+        # Несжатая плитка (QImage) или сжатые байты, где бы они ни лежали
+        if self.image is not None:
+            return self.image
+        if self.data is not None:
+            return self.data
+        if self.chunk is not None:
+            return self.chunk.read()
+        return spill.read(self.span)
+
+    def load(self, spill):
+        if self.image is not None or self.shape is None:
+            return self.image
+        data = self.payload(spill)
+        w, h, stride, fmt = self.shape
+        # QImage поверх bytes не владеет памятью, поэтому копируем
+        return QImage(zlib.decompress(data), w, h, stride, fmt).copy()
+
+
+def compress_tile(image):
+    return zlib.compress(image.constBits().asstring(image.sizeInBytes()), 1)
+
+
+class SpillFile:
+    """Временный файл, в который дописываются сжатые шаги."""
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile(prefix='picasso-undo-')
+        self.size = 0
+        self.dead = 0
+        self._map = None
+
+    def write(self, data):
+        self.file.seek(self.size)
+        self.file.write(data)
+        span = (self.size, len(data))
+        self.size += len(data)
+        return span
+
+    def read(self, span):
+        offset, length = span
+        if self._map is None or len(self._map) < offset + length:
+            self.file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def free(self, span):
+        self.dead += span[1]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self.file.close()
+
+
+class UndoHistory:
+    """Стек отмены над TiledImage; шаг — (прежний размер, [Patch, ...]).
+
+    Изменения накапливает само хранилище плиток, commit() превращает их
+    в шаг. undo()/redo() возвращают прямоугольник для перерисовки.
+    budget_mb ограничивает память под шаги, limit — их количество.
+    Если задан journal, каждый шаг (и его отмена) попадает в журнал
+    автосохранения.
+    """
+
+    def __init__(self, tiles, budget_mb=256, limit=1000):
+        self.tiles = tiles
+        self.budget = budget_mb * 1024 * 1024
+        self.limit = limit
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self._spill = None
+        self.journal = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='undo-zlib')
+
+    def commit(self):
+        size, pending = self.tiles.take_changes()
+        if size is None and not pending:
+            return False
+        self._push((size, [Patch(key, tile) for key, tile in pending.items()]))
+        if self.journal is not None:
+            self.journal.record(size, pending)
+        return True
+
+    def undo(self):
+        return self._step(self.undo_stack, self.redo_stack)
+
+    def redo(self):
+        return self._step(self.redo_stack, self.undo_stack)
+
+    def patches(self):
+        for _, patches in self.undo_stack:
+            yield from patches
+        for _, patches in self.redo_stack:
+            yield from patches
+
+    def reset(self, undo=(), redo=()):
+        # Заменяет всю историю (например, прочитанной из проекта);
+        # незафиксированные изменения хранилища отбрасываются
+        self.tiles.take_changes()
+        for step in list(self.undo_stack) + list(self.redo_stack):
+            self._drop(step)
+        self.undo_stack = deque(undo)
+        self.redo_stack = deque(redo)
+        self._enforce_budget()
+        if self.journal is not None:
+            self.journal.checkpoint()
+
+    def payload(self, patch):
+        return patch.payload(self._spill)
+
+    def memory_usage(self):
+        return sum(p.nbytes() for p in self.patches())
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def _push(self, step):
+        self.undo_stack.append(step)
+        while len(self.undo_stack) > self.limit:
+            self._drop(self.undo_stack.popleft())
+        while self.redo_stack:
+            self._drop(self.redo_stack.pop())
+        self._enforce_budget()
+
+    def _step(self, source, target):
+        # Меняет местами плитки шага и текущие; возвращает прямоугольник
+        # для перерисовки или None. Незафиксированные изменения
+        # (например, недорисованный штрих) сначала становятся шагом.
+        self.commit()
+        if not source:
+            return None
+        size, patches = source.pop()
+        tiles = {p.key: p.load(self._spill) for p in patches}
+        self._drop((size, patches))
+        old_size, inverse = self.tiles.restore(size, tiles)
+        target.append((old_size, [Patch(key, tile) for key, tile in inverse.items()]))
+        self._enforce_budget()
+        if self.journal is not None:
+            self.journal.record(size, tiles)
+        if size is not None:
+            return self.tiles.rect()
+        return self.tiles.changed_rect(tiles)
+
+    def _drop(self, step):
+        for patch in step[1]:
+            if patch.future is not None:
+                patch.future.cancel()
+            if patch.span is not None:
+                self._spill.free(patch.span)
+
+    def _enforce_budget(self):
+        # Шаги дальше HOT_STEPS от текущего состояния сжимаются в фоне;
+        # результат забирается здесь, в потоке GUI, чтобы не делить состояние
+        cold = [p for _, patches in list(self.undo_stack)[:-HOT_STEPS] + list(self.redo_stack)[:-HOT_STEPS]
+                for p in patches if p.stored()]
+        for patch in cold:
+            if patch.image is None:
+                continue
+            if patch.future is None:
+                patch.future = self._executor.submit(compress_tile, patch.image)
+            elif patch.future.done():
+                patch.data = patch.future.result()
+                patch.image = patch.future = None
+
+        # Самые старые шаги, не влезающие в бюджет, уходят на диск
+        used = self.memory_usage()
+        for patch in cold:
+            if used <= self.budget:
+                break
+            if patch.span is not None or patch.chunk is not None:
+                continue
+            before = patch.nbytes()
+            if patch.image is not None:
+                patch.data = patch.future.result()
+                patch.image = patch.future = None
+            if self._spill is None:
+                self._spill = SpillFile()
+            patch.span = self._spill.write(patch.data)
+            patch.data = None
+            used -= before
+
+        if self._spill is not None and self._spill.dead > SPILL_COMPACT_BYTES \
+                and self._spill.dead > self._spill.size - self._spill.dead:
+            self._compact()
+
+    def _compact(self):
+        old, self._spill = self._spill, SpillFile()
+        for patch in self.patches():
+            if patch.span is not None:
+                patch.span = self._spill.write(old.read(patch.span))
+        old.close()
+
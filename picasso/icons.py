@@ -0,0 +1,143 @@
+"""Иконки интерфейса, собранные в один файл.
+
+Исходные PNG в icons/ бывают огромными (до 2000x2000), и их
+декодирование при первой отрисовке панелей занимало больше 100 мс.
+Сборка уменьшает каждую иконку до SIDE пикселей и складывает их
+в один атлас, а оглавление кладёт в текстовое поле того же PNG:
+при запуске атлас читается одним обращением к диску.
+
+Иконки, которых нет в icons/ (фигуры, пипетка, текст), сборка рисует
+сама. В сборке PyInstaller атлас нужно положить рядом с программой:
+--add-data icons/bundle.png:icons.
+
+    python -m picasso.icons    # пересобрать icons/bundle.png
+"""
+
+import json
+import os
+import sys
+
+from PyQt6.QtCore import QPoint, QRect, QSize, Qt
+from PyQt6.QtGui import QColor, QFont, QIcon, QImage, QImageReader, QImageWriter, QPainter, QPen, QPixmap
+
+from .shapes import draw_shape
+
+# В сборке PyInstaller данные программы лежат в sys._MEIPASS
+BASE_DIR = getattr(sys, '_MEIPASS', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ICON_DIR = os.path.join(BASE_DIR, 'icons')
+BUNDLE = os.path.join(ICON_DIR, 'bundle.png')
+# Сторона иконки в атласе: с запасом для панелей 16–24 px и экранов HiDPI
+SIDE = 32
+# Ключ текстового поля PNG с оглавлением {имя: [x, y, ширина, высота]}
+INDEX_KEY = 'picasso-icons'
+# Иконки, которые рисуются при сборке, если их файлов нет
+DRAWN = ['arrow', 'circle', 'line', 'none', 'pipette', 'square', 'text']
+
+_atlas = None
+_icons = {}
+
+
+def read_icon(path, side=SIDE):
+    """Читает иконку, сразу уменьшая её до side при декодировании."""
+    reader = QImageReader(path)
+    size = reader.size()
+    if size.isValid() and (size.width() > side or size.height() > side):
+        reader.setScaledSize(size.scaled(side, side, Qt.AspectRatioMode.KeepAspectRatio))
+    return reader.read()
+
+
+def draw_icon(name, side=SIDE):
+    """Рисует простую замену иконки name из DRAWN."""
+    image = QImage(side, side, QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.transparent)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setPen(QPen(QColor('#000000'), 2))
+    m = side // 6
+    low, high = m, side - m - 1
+    if name in ('square', 'circle'):
+        draw_shape(painter, name, QPoint(low, low), QPoint(high, high))
+    elif name in ('line', 'arrow'):
+        draw_shape(painter, name, QPoint(low, high), QPoint(high, low))
+    elif name == 'none':
+        painter.drawEllipse(QRect(QPoint(low, low), QPoint(high, high)))
+        painter.drawLine(QPoint(low, high), QPoint(high, low))
+    elif name == 'pipette':
+        painter.setPen(QPen(QColor('#000000'), 3, cap=Qt.PenCapStyle.RoundCap))
+        painter.drawLine(QPoint(low, high), QPoint(side // 2 + m, side // 2 - m))
+        painter.setBrush(QColor('#000000'))
+        painter.drawEllipse(QRect(side // 2 + m // 2, m, side // 2 - m - 1, side // 2 - m - 1))
+    elif name == 'text':
+        font = QFont()
+        font.setBold(True)
+        font.setPixelSize(side - 2 * m)
+        painter.setFont(font)
+        painter.drawText(image.rect(), Qt.AlignmentFlag.AlignCenter, "T")
+    painter.end()
+    return image
+
+
+def build(source=ICON_DIR, target=BUNDLE, side=SIDE):
+    """Собирает все PNG из source и недостающие иконки из DRAWN в атлас
+    target; возвращает оглавление."""
+    files = {os.path.splitext(n)[0] for n in os.listdir(source)
+             if n.endswith('.png') and os.path.join(source, n) != target}
+    names = sorted(files | set(DRAWN))
+    atlas = QImage(QSize(max(1, len(names)) * side, side), QImage.Format.Format_ARGB32_Premultiplied)
+    atlas.fill(Qt.GlobalColor.transparent)
+    index = {}
+    painter = QPainter(atlas)
+    for i, name in enumerate(names):
+        if name in files:
+            image = read_icon(os.path.join(source, name + '.png'), side)
+        else:
+            image = draw_icon(name, side)
+        if image.isNull():
+            print(f"⚠ Не удалось прочитать иконку {name}")
+            continue
+        x, y = i * side + (side - image.width()) // 2, (side - image.height()) // 2
+        painter.drawImage(x, y, image)
+        index[name] = [x, y, image.width(), image.height()]
+    painter.end()
+
+    writer = QImageWriter(target, b'png')
+    writer.setText(INDEX_KEY, json.dumps(index))
+    if not writer.write(atlas):
+        raise OSError(f"не удалось записать {target}: {writer.errorString()}")
+    return index
+
+
+def _load(path=BUNDLE):
+    global _atlas
+    image = QImage(path)
+    try:
+        index = json.loads(image.text(INDEX_KEY))
+    except ValueError:
+        index = {}
+    _atlas = (image, index)
+
+
+def icon(name):
+    """QIcon по имени файла из icons/ без расширения; каждая иконка
+    создаётся один раз. Пустой QIcon, если такой иконки нет."""
+    if name not in _icons:
+        if _atlas is None:
+            _load()
+        image, index = _atlas
+        if name in index:
+            pixmap = QPixmap.fromImage(image.copy(*index[name]))
+        else:
+            # Иконка добавлена после сборки атласа — читаем её файл
+            path = os.path.join(ICON_DIR, name + '.png')
+            pixmap = QPixmap.fromImage(read_icon(path)) if os.path.exists(path) else QPixmap()
+        _icons[name] = QIcon(pixmap) if not pixmap.isNull() else QIcon()
+    return _icons[name]
+
+
+if __name__ == '__main__':
+    from PyQt6.QtGui import QGuiApplication
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QGuiApplication(sys.argv)
+    built = build()
+    print(f"Собрано иконок: {len(built)} → {BUNDLE}")
@@ -0,0 +1,282 @@
+"""Журнал автосохранения для восстановления после сбоя.
+
+Каждый шаг истории дописывается в журнал как новые плитки, которые он
+изменил. Время от времени всё изображение (все слои) сохраняется
+контрольной точкой, и журнал начинается заново; изменение состава
+слоёв тоже сразу пишет контрольную точку, а изменение только свойств
+слоёв (в том числе фигур) — запись с новыми свойствами. После сбоя
+состояние собирается из последней контрольной точки и записей журнала
+после неё. У контрольной точки и записей есть номер поколения: если сбой
+случился между записью контрольной точки и очисткой журнала, старые
+записи в нём не совпадут с ней по поколению и будут пропущены.
+
+Записи копятся пачкой и раз в FLUSH_INTERVAL_MS сжимаются и пишутся
+на диск в отдельном потоке, так что рисование их не ждёт.
+"""
+
+import json
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt6.QtCore import QObject, QTimer, QLockFile, pyqtSignal
+from PyQt6.QtGui import QImage, QColor
+
+from .history import compress_tile
+from .layers import Document, ShapeLayer, props_to_json, props_from_json, make_layer
+from .tiles import TILE, FORMAT
+
+RECOVERY_DIR = os.path.join(os.path.expanduser('~'), '.picasso', 'recovery')
+FLUSH_INTERVAL_MS = 1000
+# Контрольная точка пишется, когда журнал вырос больше этого
+# или с предыдущей прошло больше CHECKPOINT_INTERVAL секунд
+CHECKPOINT_BYTES = 64 * 1024 * 1024
+CHECKPOINT_INTERVAL = 5 * 60
+
+# Запись: длина и crc32 тела; тело: описание в JSON, затем для каждой
+# плитки номер слоя, координаты и длина сжатых данных (0 — пустая плитка)
+_FRAME = struct.Struct('<II')
+_META = struct.Struct('<I')
+_TILE = struct.Struct('<IiiI')
+
+
+def encode_record(meta, tiles):
+    # tiles: {(номер слоя, x, y): QImage, уже сжатые данные плитки или None}
+    meta = json.dumps(meta).encode('utf-8')
+    parts = [_META.pack(len(meta)), meta]
+    for (index, tx, ty), tile in tiles.items():
+        if tile is None:
+            data = b''
+        elif isinstance(tile, QImage):
+            data = compress_tile(tile)
+        else:
+            data = bytes(tile)
+        parts.append(_TILE.pack(index, tx, ty, len(data)))
+        parts.append(data)
+    body = b''.join(parts)
+    return _FRAME.pack(len(body), zlib.crc32(body)) + body
+
+
+def read_records(data):
+    # Разбирает записи подряд; оборванная или битая запись (сбой
+    # посреди записи) и всё после неё отбрасываются
+    offset = 0
+    while offset + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, offset)
+        body = data[offset + _FRAME.size:offset + _FRAME.size + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            return
+        offset += _FRAME.size + length
+        yield decode_record(body)
+
+
+def decode_record(body):
+    (length,) = _META.unpack_from(body)
+    meta = json.loads(body[_META.size:_META.size + length])
+    offset = _META.size + length
+    tiles = {}
+    while offset < len(body):
+        index, tx, ty, length = _TILE.unpack_from(body, offset)
+        offset += _TILE.size
+        if length:
+            raw = zlib.decompress(body[offset:offset + length])
+            # QImage поверх bytes не владеет памятью, поэтому копируем
+            tiles[(index, tx, ty)] = QImage(raw, TILE, TILE, TILE * 4, FORMAT).copy()
+        else:
+            tiles[(index, tx, ty)] = None
+        offset += length
+    return meta, tiles
+
+
+class Journal(QObject):
+    """Журнал одной сессии в каталоге directory.
+
+    acquire() занимает каталог (второй запущенный экземпляр его не получит),
+    recover() читает то, что осталось от упавшей сессии, start(doc) начинает
+    новую. record() вызывает история отмены после каждого шага.
+    """
+
+    failed = pyqtSignal(str)
+
+    def __init__(self, directory=RECOVERY_DIR, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.checkpoint_path = os.path.join(directory, 'checkpoint.bin')
+        self.log_path = os.path.join(directory, 'journal.bin')
+        self.doc = None
+        self.lock = None
+        self._batch = []
+        self._log_size = 0
+        self._checkpoint_time = 0
+        # Размер и слои документа в последней контрольной точке: записи
+        # журнала ссылаются на слои по номеру в этом списке
+        self._size = None
+        self._layers = []
+        # Поколение текущей контрольной точки; время запуска делает его
+        # отличным от поколений прошлых сессий
+        self._generation = time.time_ns()
+        self._executor = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(FLUSH_INTERVAL_MS)
+        self._timer.timeout.connect(self.flush)
+
+    def acquire(self):
+        os.makedirs(self.directory, exist_ok=True)
+        lock = QLockFile(os.path.join(self.directory, 'session.lock'))
+        # Блокировка упавшего процесса снимается сама, живого — никогда
+        lock.setStaleLockTime(0)
+        if not lock.tryLock(0):
+            return False
+        self.lock = lock
+        return True
+
+    def recover(self):
+        """Документ упавшей сессии (Document) или None, если восстанавливать нечего."""
+        try:
+            with open(self.checkpoint_path, 'rb') as f:
+                checkpoint = next(read_records(f.read()), None)
+        except OSError:
+            return None
+        if checkpoint is None:
+            return None
+        meta, tiles = checkpoint
+        w, h = meta['size']
+        doc = Document(w, h, QColor.fromRgba(meta['background']))
+        doc.layers = [make_layer(w, h, QColor.fromRgba(layer['background']), props_from_json(layer))
+                      for layer in meta['layers']]
+        doc.active = meta['active']
+        generation = meta.get('generation')
+        records = [({}, tiles)]
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                # Записи других поколений остались от прежней контрольной точки
+                records += [record for record in read_records(f.read())
+                            if record[0].get('generation') == generation]
+        # Контрольная точка и записи после неё применяются одинаково
+        for meta, tiles in records:
+            if 'props' in meta:
+                for layer, props in zip(doc.layers, meta['props']):
+                    layer.set_props(props_from_json(props))
+                doc.active = meta['active']
+            for (index, tx, ty), tile in tiles.items():
+                doc.layers[index].tiles.restore(None, {(tx, ty): tile})
+        if len(doc.layers) == 1 and not doc.layers[0].tiles.tiles:
+            return None
+        return doc
+
+    def start(self, doc):
+        self.doc = doc
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='journal')
+        self.checkpoint()
+
+    def record(self, layout, keys):
+        # Шаг уже применён: запоминаем новые плитки. Копии разделяют
+        # данные с холстом, поэтому здесь ничего не копируется и не сжимается.
+        # layout — раскладка шага (None, если менялись только плитки)
+        if self._executor is None:
+            return
+        doc = self.doc
+        regrouped = doc.size() != self._size or doc.layers != self._layers
+        if regrouped or self._log_size > CHECKPOINT_BYTES \
+                or time.monotonic() - self._checkpoint_time > CHECKPOINT_INTERVAL:
+            self.checkpoint()
+            return
+        meta = {'generation': self._generation}
+        if layout is not None:
+            # Те же слои с другими свойствами: хватит самих свойств
+            meta['props'] = [props_to_json(layer.props()) for layer in doc.layers]
+            meta['active'] = doc.active
+        tiles = {}
+        for layer, tx, ty in keys:
+            tile = layer.tiles.tile((tx, ty))
+            tiles[(doc.layers.index(layer), tx, ty)] = None if tile is None else QImage(tile)
+        self._batch.append((meta, tiles))
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def checkpoint(self):
+        # Контрольная точка заменяет всё, что ещё не записано из журнала
+        self._batch.clear()
+        self._timer.stop()
+        self._checkpoint_time = time.monotonic()
+        self._size = self.doc.size()
+        self._layers = list(self.doc.layers)
+        self._generation += 1
+        snapshot = self.doc.snapshot()
+        self._executor.submit(self._write_checkpoint, snapshot, self._generation)
+
+    def flush(self):
+        if self._batch and self._executor is not None:
+            batch, self._batch = self._batch, []
+            self._executor.submit(self._write_log, batch)
+
+    def close(self, discard=True):
+        # discard=True — сессия закрыта штатно, восстанавливать нечего.
+        # Без блокировки каталог принадлежит другому экземпляру: его
+        # данные не трогаем
+        self._timer.stop()
+        if self.lock is None:
+            return
+        if self._executor is not None:
+            if not discard:
+                self.flush()
+            self._executor.shutdown(wait=True, cancel_futures=discard)
+            self._executor = None
+        if discard:
+            self.discard()
+        self.lock.unlock()
+        self.lock = None
+
+    def discard(self):
+        # Удаляет данные восстановления (например, повреждённые)
+        for path in (self.checkpoint_path, self.log_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _write_checkpoint(self, snapshot, generation):
+        try:
+            meta = {
+                'generation': generation,
+                'size': [snapshot.width(), snapshot.height()],
+                'background': snapshot.background.rgba(),
+                'active': snapshot.active,
+                'layers': [dict(props_to_json(layer.props()), background=layer.tiles.background.rgba())
+                           for layer in snapshot.layers],
+            }
+            # Растр слоя фигур не пишется: он рисуется по фигурам заново
+            tiles = {}
+            for index, layer in enumerate(snapshot.layers):
+                if isinstance(layer, ShapeLayer):
+                    continue
+                for key, tile in layer.tiles.tiles.items():
+                    tiles[(index,) + key] = tile
+                # Непрочитанные плитки проекта уже сжаты так же, как
+                # в журнале: их блоки копируются без декодирования
+                for key, source in layer.tiles.sources.items():
+                    tiles[(index,) + key] = source.read()
+            data = encode_record(meta, tiles)
+            temp_path = self.checkpoint_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.checkpoint_path)
+            # Всё, что было в журнале, теперь внутри контрольной точки
+            open(self.log_path, 'wb').close()
+            self._log_size = 0
+        except Exception as e:
+            self.failed.emit(str(e))
+
+    def _write_log(self, batch):
+        try:
+            data = b''.join(encode_record(meta, tiles) for meta, tiles in batch)
+            with open(self.log_path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_size += len(data)
+        except Exception as e:
+            self.failed.emit(str(e))
@@ -0,0 +1,519 @@
+"""Слои изображения и их кэшированная композиция.
+
+Каждый слой — своё плиточное хранилище (TiledImage), поэтому рисование
+и история отмены касаются только плиток активного слоя. Итоговое
+изображение собирается по плиткам и кэшируется; при изменении
+пересобирается только грязная часть плитки.
+
+Для истории отмены Document ведёт себя как TiledImage: ключ плитки —
+(слой, x, y), а вместо размера запоминается «раскладка» — размер
+и список слоёв с их свойствами.
+
+Слой фигур (ShapeLayer) хранит фигуры как векторы, а его плитки — лишь
+растровый кэш: фигуры входят в свойства слоя, поэтому их изменение —
+это изменение раскладки, а не плиток.
+"""
+
+import sys
+
+from PyQt6.QtCore import QRect, QPoint, QSize, Qt
+from PyQt6.QtGui import QImage, QPainter, QColor
+
+from .tiles import TiledImage, TILE, FORMAT
+from .shapes import Shape, ShapeIndex, HIT_TOLERANCE
+
+Mode = QPainter.CompositionMode
+# Режимы наложения, доступные в интерфейсе
+BLEND_MODES = {
+    "Обычный": Mode.CompositionMode_SourceOver,
+    "Умножение": Mode.CompositionMode_Multiply,
+    "Экран": Mode.CompositionMode_Screen,
+    "Перекрытие": Mode.CompositionMode_Overlay,
+    "Затемнение": Mode.CompositionMode_Darken,
+    "Осветление": Mode.CompositionMode_Lighten,
+    "Разница": Mode.CompositionMode_Difference,
+}
+
+class Layer:
+    def __init__(self, tiles, name, visible=True, opacity=1.0,
+                 blend=Mode.CompositionMode_SourceOver):
+        self.tiles = tiles
+        self.name = name
+        self.visible = visible
+        self.opacity = opacity
+        self.blend = blend
+
+    def props(self):
+        return self.name, self.visible, self.opacity, self.blend
+
+    def set_props(self, props):
+        self.name, self.visible, self.opacity, self.blend = props
+
+    def snapshot(self):
+        return Layer(self.tiles.snapshot(), *self.props())
+
+
+class ShapeLayer(Layer):
+    """Слой фигур: кортеж фигур в порядке отрисовки и растр в tiles.
+
+    Растр не попадает в историю отмены — она хранит кортеж фигур
+    в свойствах слоя, а растр перерисовывается по нему там, где
+    фигуры поменялись.
+    """
+
+    def __init__(self, tiles, name, visible=True, opacity=1.0,
+                 blend=Mode.CompositionMode_SourceOver, shapes=()):
+        # shapes должны быть уже нарисованы в tiles (см. build)
+        super().__init__(tiles, name, visible, opacity, blend)
+        tiles.track_changes = False
+        self.shapes = ()
+        self.order = {}
+        self.index = ShapeIndex()
+        self._reindex(tuple(shapes))
+
+    @classmethod
+    def build(cls, width, height, props):
+        # Слой по свойствам (из файла или журнала): растр рисуется заново
+        layer = cls(TiledImage(width, height, Qt.GlobalColor.transparent), *props)
+        rect = QRect()
+        for shape in layer.shapes:
+            rect = rect.united(shape.bounds)
+        layer.rasterize(rect)
+        return layer
+
+    def props(self):
+        return super().props() + (self.shapes,)
+
+    def set_props(self, props):
+        super().set_props(props[:4])
+        return self.set_shapes(props[4])
+
+    def snapshot(self):
+        return ShapeLayer(self.tiles.snapshot(), *self.props())
+
+    def _reindex(self, shapes):
+        old, new = set(self.shapes), set(shapes)
+        for shape in old - new:
+            self.index.remove(shape)
+        for shape in new - old:
+            self.index.add(shape)
+        self.shapes = shapes
+        self.order = {shape: z for z, shape in enumerate(shapes)}
+
+    def set_shapes(self, shapes):
+        """Заменяет фигуры; перерисовывает только область отличающихся.
+
+        Возвращает изменившийся прямоугольник.
+        """
+        shapes = tuple(shapes)
+        if shapes == self.shapes:
+            return QRect()
+        old, new = set(self.shapes), set(shapes)
+        rect = QRect()
+        for shape in old ^ new:
+            rect = rect.united(shape.bounds)
+        if rect.isEmpty():
+            # Поменялся только порядок отрисовки
+            for shape in shapes:
+                rect = rect.united(shape.bounds)
+        self._reindex(shapes)
+        self.rasterize(rect)
+        return rect
+
+    def add(self, shape):
+        self.index.add(shape)
+        self.order[shape] = len(self.shapes)
+        self.shapes += (shape,)
+        self.rasterize(shape.bounds)
+        return shape.bounds
+
+    def replace(self, old, new):
+        # Новая фигура занимает место старой в порядке отрисовки;
+        # индекс и порядок правятся точечно, без перестройки
+        z = self.order.pop(old)
+        self.index.remove(old)
+        self.index.add(new)
+        self.order[new] = z
+        self.shapes = self.shapes[:z] + (new,) + self.shapes[z + 1:]
+        rect = old.bounds.united(new.bounds)
+        self.rasterize(rect)
+        return rect
+
+    def remove(self, shape):
+        z = self.order[shape]
+        return self.set_shapes(self.shapes[:z] + self.shapes[z + 1:])
+
+    def shape_at(self, pos):
+        # Верхняя фигура под точкой или None
+        area = QRect(pos.x() - HIT_TOLERANCE, pos.y() - HIT_TOLERANCE,
+                     2 * HIT_TOLERANCE + 1, 2 * HIT_TOLERANCE + 1)
+        for shape in sorted(self.index.query(area), key=self.order.get, reverse=True):
+            if shape.hit(pos):
+                return shape
+        return None
+
+    def rasterize(self, rect):
+        # Очищает rect и рисует в нём только задевающие его фигуры
+        rect = rect.intersected(self.tiles.rect())
+        if rect.isEmpty():
+            return
+        shapes = sorted(self.index.query(rect), key=self.order.get)
+
+        def draw(painter):
+            painter.setClipRect(rect)
+            painter.setCompositionMode(Mode.CompositionMode_Source)
+            painter.fillRect(rect, Qt.GlobalColor.transparent)
+            painter.setCompositionMode(Mode.CompositionMode_SourceOver)
+            for shape in shapes:
+                shape.draw(painter)
+        self.tiles.paint(rect, draw)
+
+
+def props_to_json(props):
+    # Свойства слоя (Layer.props()) в виде для JSON
+    data = {'name': props[0], 'visible': props[1], 'opacity': props[2], 'blend': props[3].value}
+    if len(props) > 4:
+        data['shapes'] = [shape.to_json() for shape in props[4]]
+    return data
+
+
+def props_from_json(data):
+    props = (data['name'], data['visible'], data['opacity'], Mode(data['blend']))
+    if 'shapes' in data:
+        props += (tuple(Shape.from_json(shape) for shape in data['shapes']),)
+    return props
+
+
+def make_layer(width, height, background, props):
+    # Пустой слой по свойствам; слой фигур сразу рисует свои фигуры
+    if len(props) > 4:
+        return ShapeLayer.build(width, height, props)
+    return Layer(TiledImage(width, height, background), *props)
+
+
+class Document:
+    """Стопка слоёв (снизу вверх) с кэшем итогового изображения."""
+
+    def __init__(self, width, height, background=Qt.GlobalColor.white):
+        self._size = QSize(width, height)
+        # Подложка под всеми слоями
+        self.background = QColor(background)
+        self.layers = [Layer(TiledImage(width, height, background), "Фон")]
+        self.active = 0
+        # Раскладка до начала текущей операции (см. take_changes)
+        self.pending_layout = None
+        # Итоговые плитки и их устаревшие части: ключ -> QRect
+        self.cache = {}
+        self.dirty = {}
+
+    @classmethod
+    def from_tiles(cls, tiles):
+        doc = cls(tiles.width(), tiles.height(), tiles.background)
+        doc.layers[0].tiles = tiles
+        return doc
+
+    def size(self):
+        return QSize(self._size)
+
+    def width(self):
+        return self._size.width()
+
+    def height(self):
+        return self._size.height()
+
+    def rect(self):
+        return QRect(QPoint(0, 0), self._size)
+
+    def keys_in(self, rect):
+        rect = rect.intersected(self.rect())
+        if rect.isEmpty():
+            return
+        for ty in range(rect.top() // TILE, rect.bottom() // TILE + 1):
+            for tx in range(rect.left() // TILE, rect.right() // TILE + 1):
+                yield tx, ty
+
+    def tile_rect(self, key):
+        return QRect(key[-2] * TILE, key[-1] * TILE, TILE, TILE)
+
+    def layer(self):
+        return self.layers[self.active]
+
+    # --- Слои: каждая операция запоминает раскладку для отмены ---
+
+    def add_layer(self, name=None, index=None, cls=Layer):
+        self._touch_layout()
+        index = self.active + 1 if index is None else index
+        name = name or f"Слой {len(self.layers)}"
+        layer = cls(TiledImage(self.width(), self.height(), Qt.GlobalColor.transparent), name)
+        self.layers.insert(index, layer)
+        self.active = index
+        self.invalidate()
+        return layer
+
+    def remove_layer(self, index):
+        if len(self.layers) == 1:
+            return
+        self._touch_layout()
+        # Сам слой с плитками остаётся в раскладке истории
+        del self.layers[index]
+        self.active = min(self.active, len(self.layers) - 1)
+        self.invalidate()
+
+    def move_layer(self, index, to):
+        to = max(0, min(len(self.layers) - 1, to))
+        if to == index:
+            return
+        self._touch_layout()
+        self.layers.insert(to, self.layers.pop(index))
+        self.active = to
+        self.invalidate()
+
+    def set_layer_props(self, index, **props):
+        # name, visible, opacity, blend
+        layer = self.layers[index]
+        if all(getattr(layer, k) == v for k, v in props.items()):
+            return
+        self._touch_layout()
+        for k, v in props.items():
+            setattr(layer, k, v)
+        self.invalidate()
+
+    # --- Фигуры: тоже часть раскладки ---
+
+    def add_shape(self, shape):
+        # Фигура попадает в активный слой фигур, а если активен обычный
+        # слой — в слой фигур прямо над ним (при необходимости новый).
+        # Активным остаётся обычный слой: растровые инструменты рисуют
+        # только в нём, плитки слоя фигур — лишь кэш отрисовки
+        layer = self.layer()
+        if not isinstance(layer, ShapeLayer):
+            above = self.active + 1
+            if above < len(self.layers) and isinstance(self.layers[above], ShapeLayer):
+                layer = self.layers[above]
+            else:
+                active = self.active
+                layer = self.add_layer("Фигуры", cls=ShapeLayer)
+                self.active = active
+        self._touch_layout()
+        return self._shapes_changed(layer.add(shape))
+
+    def replace_shape(self, layer, old, new):
+        self._touch_layout()
+        return self._shapes_changed(layer.replace(old, new))
+
+    def remove_shape(self, layer, shape):
+        self._touch_layout()
+        return self._shapes_changed(layer.remove(shape))
+
+    def shape_at(self, pos):
+        """(слой, фигура) — верхняя видимая фигура под точкой, или None."""
+        for layer in reversed(self.layers):
+            if isinstance(layer, ShapeLayer) and layer.visible:
+                shape = layer.shape_at(pos)
+                if shape is not None:
+                    return layer, shape
+        return None
+
+    def _shapes_changed(self, rect):
+        self.invalidate(rect)
+        return rect
+
+    def _touch_layout(self):
+        if self.pending_layout is None:
+            self.pending_layout = self._layout()
+
+    def _layout(self):
+        return self.size(), [(layer, layer.props()) for layer in self.layers]
+
+    # --- Итоговое изображение ---
+
+    def _visible(self):
+        return [layer for layer in self.layers if layer.visible and layer.opacity > 0]
+
+    def _single(self, visible):
+        # Один непрозрачный слой без эффектов показывается как есть,
+        # без копии в кэше
+        if len(visible) != 1:
+            return None
+        layer = visible[0]
+        if layer.opacity < 1 or layer.blend != Mode.CompositionMode_SourceOver \
+                or layer.tiles.background != self.background:
+            return None
+        return layer
+
+    def invalidate(self, rect=None):
+        # Помечает часть итогового изображения устаревшей
+        if rect is None:
+            self.cache.clear()
+            self.dirty.clear()
+            return
+        for key in self.keys_in(rect):
+            if key in self.cache:
+                area = self.tile_rect(key).intersected(rect)
+                self.dirty[key] = self.dirty.get(key, QRect()).united(area)
+
+    def tile(self, key):
+        """Итоговая плитка; None — плитка целиком из подложки."""
+        visible = self._visible()
+        single = self._single(visible)
+        if single is not None:
+            return single.tiles.tile(key)
+
+        tile = self.cache.get(key)
+        area = self.dirty.pop(key, None)
+        if tile is None:
+            tile = self.cache[key] = QImage(TILE, TILE, FORMAT)
+            area = self.tile_rect(key)
+        elif area is None:
+            return tile
+
+        # Пересобираем только устаревший прямоугольник плитки
+        painter = QPainter(tile)
+        painter.translate(-key[0] * TILE, -key[1] * TILE)
+        painter.setClipRect(area)
+        painter.setCompositionMode(Mode.CompositionMode_Source)
+        painter.fillRect(area, self.background)
+        for layer in visible:
+            painter.setCompositionMode(layer.blend)
+            painter.setOpacity(layer.opacity)
+            if layer.tiles.tile(key) is None and layer.tiles.background.alpha() == 0:
+                continue
+            layer.tiles.draw(painter, area)
+        painter.end()
+        return tile
+
+    def draw(self, painter, rect, target=None):
+        rect = rect.intersected(self.rect())
+        offset = QPoint(0, 0) if target is None else target - rect.topLeft()
+        for key in self.keys_in(rect):
+            area = self.tile_rect(key).intersected(rect)
+            tile = self.tile(key)
+            if tile is None:
+                painter.fillRect(area.translated(offset), self.background)
+            else:
+                source = area.translated(-key[0] * TILE, -key[1] * TILE)
+                painter.drawImage(area.translated(offset), tile, source)
+
+    def copy(self, rect=None):
+        rect = self.rect() if rect is None else rect.intersected(self.rect())
+        image = QImage(rect.size(), FORMAT)
+        painter = QPainter(image)
+        painter.setCompositionMode(Mode.CompositionMode_Source)
+        self.draw(painter, rect, QPoint(0, 0))
+        painter.end()
+        return image
+
+    def to_image(self):
+        return self.copy()
+
+    def pixel_color(self, pos):
+        tile = self.tile((pos.x() // TILE, pos.y() // TILE))
+        if tile is None:
+            return QColor(self.background)
+        return tile.pixelColor(pos.x() % TILE, pos.y() % TILE)
+
+    def average_color(self, pos, size=1):
+        """Цвет итоговой картинки в pos; при size > 1 — среднее по квадрату
+        size x size вокруг pos. Читает прямо из плиток, без копии изображения."""
+        if not self.rect().contains(pos):
+            return None
+        if size <= 1:
+            return self.pixel_color(pos)
+
+        r = size // 2
+        window = QRect(pos.x() - r, pos.y() - r, size, size).intersected(self.rect())
+        # Каналы в памяти лежат как B, G, R, A (на little-endian)
+        ib, ig, ir, ia = (0, 1, 2, 3) if sys.byteorder == "little" else (3, 2, 1, 0)
+
+        sb = sg = sr = sa = 0
+        for key in self.keys_in(window):
+            area = self.tile_rect(key).intersected(window)
+            tile = self.tile(key)
+            if tile is None:
+                bg, n = self.background, area.width() * area.height()
+                sb += bg.blue() * bg.alpha() // 255 * n
+                sg += bg.green() * bg.alpha() // 255 * n
+                sr += bg.red() * bg.alpha() // 255 * n
+                sa += bg.alpha() * n
+                continue
+            bits = tile.constBits()
+            bits.setsize(tile.sizeInBytes())
+            buf = memoryview(bits)
+            stride = tile.bytesPerLine()
+            area.translate(-key[0] * TILE, -key[1] * TILE)
+            for y in range(area.top(), area.bottom() + 1):
+                row = y * stride
+                for off in range(row + 4 * area.left(), row + 4 * area.right() + 4, 4):
+                    sb += buf[off + ib]
+                    sg += buf[off + ig]
+                    sr += buf[off + ir]
+                    sa += buf[off + ia]
+        if sa == 0:
+            return QColor(0, 0, 0, 0)
+        # Значения премультиплицированы, поэтому делим на суммарную альфу
+        count = window.width() * window.height()
+        return QColor(min(255, round(sr * 255 / sa)), min(255, round(sg * 255 / sa)),
+                      min(255, round(sb * 255 / sa)), round(sa / count))
+
+    def snapshot(self):
+        # Копия для фоновых задач; плитки слоёв разделяют данные с оригиналом
+        snap = Document(self.width(), self.height(), self.background)
+        snap.layers = [layer.snapshot() for layer in self.layers]
+        snap.active = self.active
+        return snap
+
+    # --- Хранилище для истории отмены ---
+
+    def replace(self, other):
+        # Новый документ целиком; прежние слои остаются в раскладке истории
+        self._touch_layout()
+        self._size = other.size()
+        self.background = QColor(other.background)
+        self.layers = list(other.layers)
+        self.active = other.active
+        self.invalidate()
+
+    def clear(self):
+        self.replace(Document(self.width(), self.height(), self.background))
+
+    def take_changes(self):
+        """Забирает изменения: (прежняя раскладка или None, {(слой, x, y): плитка})."""
+        layout, self.pending_layout = self.pending_layout, None
+        pending = {}
+        layers = self.layers if layout is None else \
+            list({id(layer): layer for layer in self.layers + [layer for layer, _ in layout[1]]}.values())
+        for layer in layers:
+            _, tiles = layer.tiles.take_changes()
+            for key, tile in tiles.items():
+                pending[(layer,) + key] = tile
+        return layout, pending
+
+    def restore(self, layout, tiles):
+        """Возвращает плитки и раскладку к сохранённым; отдаёт обратный шаг."""
+        old_layout = None
+        if layout is not None:
+            old_layout = self._layout()
+            size, layers = layout
+            self._size = QSize(size)
+            active = self.layer() if self.layers else None
+            self.layers = []
+            for layer, props in layers:
+                layer.set_props(props)
+                self.layers.append(layer)
+            self.active = self.layers.index(active) if active in self.layers else len(self.layers) - 1
+            self.invalidate()
+        inverse = {}
+        by_layer = {}
+        for (layer, tx, ty), tile in tiles.items():
+            by_layer.setdefault(layer, {})[(tx, ty)] = tile
+        for layer, part in by_layer.items():
+            _, back = layer.tiles.restore(None, part)
+            for key, tile in back.items():
+                inverse[(layer,) + key] = tile
+        return old_layout, inverse
+
+    def changed_rect(self, keys):
+        rect = QRect()
+        for key in keys:
+            rect = rect.united(self.tile_rect(key))
+        return rect.intersected(self.rect())
@@ -0,0 +1,85 @@
+"""Фоновое открытие изображений: декодирование и разбиение на плитки
+в пуле потоков, с прогрессом и отменой."""
+
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QSize, QThreadPool, Qt, pyqtSignal
+from PyQt6.QtGui import QImageReader
+
+from .tiles import TiledImage
+
+# Картинки с большей стороной крупнее этой декодируются сразу уменьшенными
+MAX_IMAGE_SIDE = 16384
+ALLOCATION_LIMIT_MB = 1024
+
+
+class ImageLoader(QObject):
+    """Загружает файл в TiledImage вне потока GUI.
+
+    Сигналы приходят в поток, где живёт загрузчик (очередью).
+    finished испускается всегда — после loaded, failed или отмены.
+    """
+
+    progress = pyqtSignal(int)
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, path, max_side=MAX_IMAGE_SIDE, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.max_side = max_side
+        self._cancelled = threading.Event()
+
+    def start(self, pool=None):
+        (pool or QThreadPool.globalInstance()).start(_LoadTask(self))
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def run(self):
+        try:
+            tiles = self._load()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            if tiles is not None and not self.cancelled():
+                self.loaded.emit(tiles)
+        finally:
+            self.finished.emit()
+
+    def _load(self):
+        reader = QImageReader(self.path)
+        reader.setAllocationLimit(ALLOCATION_LIMIT_MB)
+        size = reader.size()
+        if size.isValid() and max(size.width(), size.height()) > self.max_side:
+            # Декодер сразу выдаёт уменьшенную картинку (JPEG умеет это дёшево)
+            reader.setScaledSize(size.scaled(QSize(self.max_side, self.max_side),
+                                             Qt.AspectRatioMode.KeepAspectRatio))
+        self.progress.emit(5)
+        if self.cancelled():
+            return None
+
+        image = reader.read()
+        if image.isNull():
+            raise OSError(f"{self.path}: {reader.errorString()}")
+        self.progress.emit(50)
+        if self.cancelled():
+            return None
+
+        def progress(done, total):
+            self.progress.emit(50 + 50 * done // total)
+            return not self.cancelled()
+        return TiledImage.from_image(image, progress=progress)
+
+
+class _LoadTask(QRunnable):
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def run(self):
+        self.loader.run()
@@ -0,0 +1,74 @@
+"""Кэш уменьшенных копий (mip-уровней) плиток для отрисовки с масштабом.
+
+Уровень L плитки — её копия, уменьшенная в 2**L раз; строится лениво
+из уровня L-1. При изменении холста сбрасываются только уровни
+задетых плиток.
+"""
+
+import math
+
+from PyQt6.QtCore import QRect, QRectF, Qt
+from PyQt6.QtGui import QPainter
+
+from .tiles import TILE
+
+LEVELS = 5
+
+
+class MipCache:
+    def __init__(self, tiles, levels=LEVELS):
+        self.tiles = tiles
+        self.levels = levels
+        self.cache = {}
+
+    def level_for(self, zoom):
+        # Самый мелкий уровень, который всё ещё не меньше нужного размера
+        if zoom >= 1:
+            return 0
+        return min(self.levels, int(math.floor(math.log2(1 / zoom))))
+
+    def tile(self, key, level):
+        tile = self.tiles.tile(key)
+        if tile is None or level == 0:
+            return tile
+        mip = self.cache.get((key, level))
+        if mip is None:
+            size = TILE >> level
+            mip = self.tile(key, level - 1).scaled(
+                size, size, Qt.AspectRatioMode.IgnoreAspectRatio,
+                Qt.TransformationMode.SmoothTransformation)
+            self.cache[(key, level)] = mip
+        return mip
+
+    def invalidate(self, rect=None):
+        if rect is None:
+            self.cache.clear()
+            return
+        for key in self.tiles.keys_in(rect):
+            for level in range(1, self.levels + 1):
+                self.cache.pop((key, level), None)
+
+    def draw(self, painter, rect, zoom):
+        # rect — область виджета; плитки рисуются с масштабом zoom
+        # из ближайшего подходящего mip-уровня
+        level = self.level_for(zoom)
+        scale = 1 << level
+        bounds = self.tiles.rect()
+        visible = QRectF(rect.x() / zoom, rect.y() / zoom,
+                         rect.width() / zoom, rect.height() / zoom).toAlignedRect()
+        if zoom < 1:
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        for key in self.tiles.keys_in(visible):
+            area = self.tiles.tile_rect(key).intersected(bounds)
+            # Края считаем от целых координат, чтобы между плитками не было щелей
+            left, top = math.floor(area.left() * zoom), math.floor(area.top() * zoom)
+            right = math.floor((area.right() + 1) * zoom)
+            bottom = math.floor((area.bottom() + 1) * zoom)
+            target = QRect(left, top, right - left, bottom - top)
+            tile = self.tile(key, level)
+            if tile is None:
+                painter.fillRect(target, self.tiles.background)
+                continue
+            source = QRectF((area.x() - key[0] * TILE) / scale, (area.y() - key[1] * TILE) / scale,
+                            area.width() / scale, area.height() / scale)
+            painter.drawImage(QRectF(target), tile, source)
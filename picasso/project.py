@@ -0,0 +1,415 @@
+"""Файл проекта Picasso (*.picasso): слои, история отмены и метаданные
+в одном контейнере.
+
+Устройство файла:
+  заголовок — сигнатура, версия, смещение и длина оглавления;
+  блоки — плитки слоёв и шагов истории, каждый сжат zlib отдельно;
+  оглавление — сжатый JSON со слоями, историей и метаданными.
+
+Слой в файле — номер в списке слоёв оглавления; туда же попадают
+удалённые слои, на которые ещё ссылается история отмены. У слоя фигур
+в оглавлении лежат сами фигуры, а его растр при открытии рисуется заново.
+
+Сохранение в тот же файл дописывает в конец только новые блоки и новое
+оглавление и лишь затем переписывает заголовок, поэтому сбой посреди
+записи оставляет прежнюю версию целой. Когда мусора в файле становится
+больше, чем данных, он переписывается целиком.
+
+Открытие отображает файл в память (mmap) и ничего не декодирует:
+плитки читаются, когда впервые попадают на экран.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import weakref
+import zlib
+
+from PyQt6.QtCore import QSize
+from PyQt6.QtGui import QImage, QColor
+
+from .history import Patch, compress_tile
+from .layers import Document, ShapeLayer, props_to_json, props_from_json, make_layer
+from .tiles import TILE, FORMAT
+
+PROJECT_EXT = '.picasso'
+MAGIC = b'PICASSO\0'
+VERSION = 1
+# Сигнатура, версия, резерв, смещение и длина оглавления
+_HEADER = struct.Struct('<8sIIQQ')
+# Мусор меньше этого не стоит полной перезаписи файла
+COMPACT_BYTES = 16 * 1024 * 1024
+
+
+def _props(entry):
+    # Свойства слоя в раскладке шага: [имя, видимость, непрозрачность,
+    # режим наложения] и для слоя фигур — список фигур
+    data = dict(zip(('name', 'visible', 'opacity', 'blend', 'shapes'), entry))
+    return props_from_json(data)
+
+
+def _read_index(project, path):
+    # Оглавление файла проекта -> (project, Document, undo, redo)
+    if project.size < _HEADER.size:
+        raise ValueError(f"{path}: это не файл проекта Picasso")
+    magic, version, _, offset, length = _HEADER.unpack_from(project._map)
+    if magic != MAGIC or version > VERSION:
+        raise ValueError(f"{path}: это не файл проекта Picasso или он слишком новый")
+    index = json.loads(zlib.decompress(project._map[offset:offset + length]))
+    project.metadata = index['metadata']
+    project.live = _HEADER.size + length
+
+    chunks = {}
+
+    def chunk(offset, length):
+        # Одинаковые плитки ссылаются на один блок
+        if offset not in chunks:
+            chunks[offset] = Chunk(project, offset, length)
+            project.live += length
+        return chunks[offset]
+
+    layers = []
+    for layer in index['layers']:
+        layers.append(make_layer(layer['width'], layer['height'], QColor.fromRgba(layer['background']),
+                                 props_from_json(layer)))
+        layers[-1].tiles.sources = {(tx, ty): chunk(off, n) for tx, ty, off, n in layer['tiles']}
+    doc = Document(*index['size'], QColor.fromRgba(index['background']))
+    doc.layers = layers[:index['count']]
+    doc.active = index['active']
+
+    def steps(entries):
+        result = []
+        for step in entries:
+            patches = []
+            for entry in step['patches']:
+                key = (layers[entry[0]], entry[1], entry[2])
+                if len(entry) == 3:
+                    patch = Patch(key, None)
+                else:
+                    off, n, w, h, stride, fmt = entry[3:]
+                    patch = Patch.from_chunk(key, chunk(off, n), (w, h, stride, QImage.Format(fmt)))
+                    project.patches[id(patch)] = (patch, patch.chunk)
+                patches.append(patch)
+            layout = step['layout']
+            if layout is not None:
+                layout = QSize(*layout['size']), [(layers[entry[0]], _props(entry[1:]))
+                                                  for entry in layout['layers']]
+            result.append((layout, patches))
+        return result
+
+    return project, doc, steps(index['undo']), steps(index['redo'])
+
+
+class Chunk:
+    """Сжатый блок файла проекта; вызов декодирует его как плитку.
+
+    С register=True (только в потоке GUI) плитка запоминается в
+    project.known, чтобы сохранение узнало её неизменённой.
+    """
+
+    __slots__ = ('project', 'offset', 'length', 'data', '__weakref__')
+
+    def __init__(self, project, offset, length):
+        self.project = project
+        self.offset = offset
+        self.length = length
+        # Данные блока, которого уже нет в файле (см. ProjectJob.finish)
+        self.data = None
+        project.chunks.add(self)
+
+    def read(self):
+        return self.project.read(self)
+
+    def __call__(self, register=True):
+        tile = QImage(zlib.decompress(self.read()), TILE, TILE, TILE * 4, FORMAT).copy()
+        if register:
+            self.project.known[tile.cacheKey()] = self
+        return tile
+
+
+class Project:
+    """Открытый (или ещё не сохранённый) файл проекта.
+
+    Помнит, какие плитки и шаги истории уже лежат в файле, чтобы
+    следующее сохранение записало только изменившиеся.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.metadata = {}
+        self._file = None
+        self._map = None
+        self._lock = threading.Lock()
+        # Все живые блоки: при полной перезаписи их смещения обновляются
+        self.chunks = weakref.WeakSet()
+        # cacheKey плитки -> блок с теми же пикселями
+        self.known = {}
+        # id(Patch) -> (Patch, блок)
+        self.patches = {}
+        self.size = 0
+        self.live = 0
+
+    @classmethod
+    def open(cls, path):
+        """Открывает проект; возвращает (project, Document, undo, redo).
+
+        Плитки слоёв и шагов истории остаются в файле до первого обращения.
+        """
+        project = cls()
+        project._attach(path)
+        try:
+            return _read_index(project, path)
+        except ValueError:
+            project.close()
+            raise
+        except (KeyError, IndexError, TypeError, zlib.error, struct.error) as e:
+            # Обрезанный или испорченный файл — та же ошибка, что и чужой
+            project.close()
+            raise ValueError(f"{path}: файл проекта повреждён ({e})") from e
+
+    def read(self, chunk):
+        with self._lock:
+            if chunk.offset is None:
+                return chunk.data
+            return self._map[chunk.offset:chunk.offset + chunk.length]
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._file.close()
+            self._map = self._file = None
+
+    def save_job(self, path, doc, history):
+        """Задание для ImageSaver: сохранить документ doc вместе с историей."""
+        return ProjectJob(self, path, doc, history)
+
+    def _attach(self, path):
+        # Отображает файл в память заново (после дописывания или замены)
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._file.close()
+            self.path = path
+            self._file = open(path, 'rb')
+            self.size = os.fstat(self._file.fileno()).st_size
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+
+class ProjectJob:
+    """Сохранение проекта: снимок берётся сразу, решение, какие блоки
+    переиспользовать, — в prepare(), запись — в run()."""
+
+    def __init__(self, project, path, doc, history):
+        self.project = project
+        self.path = path
+        stacks = [list(history.undo_stack), list(history.redo_stack)]
+        # Слои документа, а за ними — слои, известные только истории
+        layers = list(doc.layers)
+        for stack in stacks:
+            for layout, patches in stack:
+                for layer in [layer for layer, _ in layout[1]] if layout is not None else []:
+                    if layer not in layers:
+                        layers.append(layer)
+                for patch in patches:
+                    if patch.key[0] not in layers:
+                        layers.append(patch.key[0])
+        number = {id(layer): i for i, layer in enumerate(layers)}
+        # Растр слоя фигур не сохраняется: он рисуется по фигурам
+        self.layers = [(layer.props(), layer.tiles.snapshot() if not isinstance(layer, ShapeLayer)
+                        else None, layer.tiles.size(), layer.tiles.background) for layer in layers]
+        self.document = {'size': [doc.width(), doc.height()], 'background': doc.background.rgba(),
+                         'count': len(doc.layers), 'active': doc.active}
+
+        # Шаги истории фиксируются сейчас; для ещё не записанных плиток
+        # берём их данные, пока история не успела их выгрузить или выбросить
+        self.steps = []
+        for stack in stacks:
+            steps = []
+            for layout, patches in stack:
+                if layout is not None:
+                    size, entries = layout
+                    layout = {'size': [size.width(), size.height()],
+                              'layers': [[number[id(layer)]] + list(props_to_json(props).values())
+                                         for layer, props in entries]}
+                steps.append((layout, [((number[id(p.key[0])],) + p.key[1:], p,
+                                        None if id(p) in project.patches or not p.stored()
+                                        else history.payload(p)) for p in patches]))
+            self.steps.append(steps)
+        self.rewrite = False
+        self.entries = None
+        self.result = None
+
+    def prepare(self):
+        project = self.project
+        # Полная перезапись: новый файл или слишком много мусора в старом
+        self.rewrite = project.path != self.path or project._map is None \
+            or project.size - project.live > max(project.live, COMPACT_BYTES)
+
+        layers = []
+        for props, tiles, size, background in self.layers:
+            entries = []
+            for key in sorted(tiles.keys() if tiles is not None else ()):
+                source = tiles.sources.get(key)
+                if isinstance(source, Chunk) and source.project is project and source.offset is not None:
+                    entries.append((key, source))
+                    continue
+                tile = tiles.tiles.get(key)
+                chunk = None if tile is None else project.known.get(tile.cacheKey())
+                if chunk is not None and chunk.offset is not None:
+                    entries.append((key, chunk))
+                else:
+                    # Несжатая плитка или отложенная плитка чужого файла
+                    entries.append((key, tile if tile is not None else source))
+            layers.append((props, size, background, entries))
+
+        stacks = []
+        for steps in self.steps:
+            stack = []
+            for layout, patches in steps:
+                entries = []
+                for key, patch, payload in patches:
+                    if not patch.stored():
+                        entries.append((key, patch, None))
+                    elif id(patch) in project.patches:
+                        entries.append((key, patch, project.patches[id(patch)][1]))
+                    else:
+                        entries.append((key, patch, payload))
+                stack.append((layout, entries))
+            stacks.append(stack)
+        self.entries = layers, stacks
+
+    def run(self):
+        layers, stacks = self.entries
+        project = self.project
+        if self.rewrite:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            temp_path = os.path.join(directory, '.' + os.path.basename(self.path) + '.tmp')
+            f = open(temp_path, 'wb')
+            f.write(b'\0' * _HEADER.size)
+        else:
+            temp_path = None
+            f = open(self.path, 'r+b')
+            f.seek(project.size)
+
+        # Блоки: старые переписываются только при полной перезаписи,
+        # новые сжимаются здесь, в пуле потоков
+        placed = {}
+        written = []
+
+        def place(item):
+            if id(item) in placed:
+                return placed[id(item)]
+            if isinstance(item, Chunk):
+                if item.project is project and not self.rewrite:
+                    placed[id(item)] = item.offset, item.length
+                    return placed[id(item)]
+                # Блок этого или чужого файла переносится сжатым, без
+                # декодирования: оно трогало бы known вне потока GUI
+                data = item.read()
+            elif isinstance(item, bytes):
+                data = item
+            else:
+                data = compress_tile(item)
+            span = placed[id(item)] = f.tell(), len(data)
+            f.write(data)
+            written.append((item, span))
+            return span
+
+        try:
+            index_layers = []
+            for props, size, background, entries in layers:
+                tiles = []
+                for key, item in entries:
+                    offset, length = place(item)
+                    tiles.append([key[0], key[1], offset, length])
+                index_layers.append(dict(props_to_json(props), width=size.width(), height=size.height(),
+                                         background=background.rgba(), tiles=tiles))
+
+            index_stacks = []
+            for stack in stacks:
+                steps = []
+                for layout, entries in stack:
+                    patches = []
+                    for key, patch, item in entries:
+                        if item is None:
+                            patches.append(list(key))
+                            continue
+                        offset, length = place(item)
+                        w, h, stride, fmt = patch.shape
+                        patches.append(list(key) + [offset, length, w, h, stride, fmt.value])
+                    steps.append({'layout': layout, 'patches': patches})
+                index_stacks.append(steps)
+
+            now = time.strftime('%Y-%m-%dT%H:%M:%S')
+            metadata = dict(project.metadata, modified=now)
+            metadata.setdefault('created', now)
+            index = zlib.compress(json.dumps(dict(
+                self.document, metadata=metadata, layers=index_layers,
+                undo=index_stacks[0], redo=index_stacks[1],
+            )).encode('utf-8'), 6)
+            index_offset = f.tell()
+            f.write(index)
+            f.flush()
+            os.fsync(f.fileno())
+            # Заголовок переписывается последним: до этого файл указывает
+            # на прежнее, целое оглавление
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, VERSION, 0, index_offset, len(index)))
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        except BaseException:
+            f.close()
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        live = _HEADER.size + len(index) + sum(length for _, length in set(placed.values()))
+        self.result = temp_path, placed, written, metadata, live
+
+    def finish(self):
+        temp_path, placed, written, metadata, live = self.result
+        layers, stacks = self.entries
+        project = self.project
+        # Сначала забываем блоки, которых нет в новом оглавлении
+        project.patches = {id(patch): (patch, item) for stack in stacks for _, entries in stack
+                           for _, patch, item in entries if isinstance(item, Chunk)}
+        project.known = {key: chunk for key, chunk in project.known.items() if id(chunk) in placed}
+        if temp_path is not None:
+            with project._lock:
+                # Блоки, которые ещё кто-то держит (например, снимок для
+                # журнала), но которых нет в новом файле, переносим в память
+                for chunk in list(project.chunks):
+                    span = placed.get(id(chunk))
+                    if span is None:
+                        chunk.data = project._map[chunk.offset:chunk.offset + chunk.length]
+                        chunk.offset = None
+                    else:
+                        chunk.offset = span[0]
+                # Старое отображение закрываем до замены файла
+                if project._map is not None:
+                    project._map.close()
+                    project._file.close()
+                    project._map = project._file = None
+                os.replace(temp_path, self.path)
+        project._attach(self.path)
+        project.metadata = metadata
+        project.live = live
+
+        # Новые блоки: запоминаем, чьи пиксели в них лежат
+        chunks = {}
+        for item, (offset, length) in written:
+            if isinstance(item, Chunk):
+                continue
+            chunk = chunks[id(item)] = Chunk(project, offset, length)
+            if isinstance(item, QImage):
+                project.known[item.cacheKey()] = chunk
+        for stack in stacks:
+            for _, entries in stack:
+                for _, patch, item in entries:
+                    if id(item) in chunks:
+                        project.patches[id(patch)] = (patch, chunks[id(item)])
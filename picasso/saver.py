@@ -0,0 +1,144 @@
+"""Фоновое сохранение: снимок холста без копирования пикселей,
+кодирование в пуле потоков и атомарная запись через временный файл.
+
+Сохранение описывается заданием с тремя шагами: prepare() — в потоке GUI
+перед запуском, run() — в пуле потоков, finish() — снова в потоке GUI
+после успешной записи.
+"""
+
+import os
+import tempfile
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QImageWriter
+
+# Уровень сжатия zlib (0 — быстрее всего, 9 — файл меньше всего)
+DEFAULT_COMPRESSION = 6
+
+# umask читается один раз при импорте: os.umask меняет его для всего
+# процесса, а запись идёт из пула потоков
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def png_quality(level):
+    # Qt задаёт сжатие PNG через «качество»: 100 — без сжатия, 9 и меньше — максимум
+    return 100 - round(max(0, min(9, level)) * 91 / 9)
+
+
+def file_mode(path):
+    # Права для файла path: как у существующего, иначе как у обычного нового
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def write_png(image, path, compression=DEFAULT_COMPRESSION):
+    # Пишем во временный файл рядом с целевым и подменяем его одним rename,
+    # чтобы при сбое не остался наполовину записанный файл
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.picasso-', suffix='.png', dir=directory)
+    os.close(fd)
+    try:
+        writer = QImageWriter(temp_path, b'png')
+        writer.setQuality(png_quality(compression))
+        if not writer.write(image):
+            raise OSError(f"{path}: {writer.errorString()}")
+        # mkstemp создаёт файл с правами 0600, а rename их сохраняет
+        os.chmod(temp_path, file_mode(path))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class PngJob:
+    def __init__(self, tiles, path, compression=DEFAULT_COMPRESSION):
+        # Снимок разделяет плитки с холстом; рисование дальше их отделит
+        self.snapshot = tiles.snapshot()
+        self.path = path
+        self.compression = compression
+
+    def prepare(self):
+        pass
+
+    def run(self):
+        write_png(self.snapshot.to_image(), self.path, self.compression)
+
+    def finish(self):
+        pass
+
+
+class ImageSaver(QObject):
+    """Очередь сохранений: одно выполняется, ещё одно ждёт.
+
+    Повторные запросы, пришедшие во время записи, заменяют ожидающий,
+    так что серия Ctrl+S превращается в одну дополнительную запись.
+    """
+
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    _done = pyqtSignal(object, str)
+
+    def __init__(self, parent=None, compression=DEFAULT_COMPRESSION):
+        super().__init__(parent)
+        self.compression = compression
+        self._running = False
+        self._pending = None
+        self._done.connect(self._next)
+
+    def busy(self):
+        return self._running or self._pending is not None
+
+    def save(self, tiles, path):
+        self.submit(PngJob(tiles, path, self.compression))
+
+    def submit(self, job):
+        if self._running:
+            self._pending = job
+        else:
+            self._start(job)
+
+    def _start(self, job):
+        self._running = True
+        try:
+            job.prepare()
+        except Exception as e:
+            self._done.emit(job, str(e) or type(e).__name__)
+            return
+        QThreadPool.globalInstance().start(_SaveTask(self, job))
+
+    def _run(self, job):
+        try:
+            job.run()
+        except Exception as e:
+            self._done.emit(job, str(e) or type(e).__name__)
+        else:
+            self._done.emit(job, '')
+
+    def _next(self, job, error):
+        self._running = False
+        if not error:
+            try:
+                job.finish()
+            except Exception as e:
+                error = str(e) or type(e).__name__
+        if error:
+            self.failed.emit(error)
+        else:
+            self.saved.emit(job.path)
+        if self._pending is not None:
+            job, self._pending = self._pending, None
+            self._start(job)
+
+
+class _SaveTask(QRunnable):
+    def __init__(self, saver, job):
+        super().__init__()
+        self.saver = saver
+        self.job = job
+
+    def run(self):
+        self.saver._run(self.job)
@@ -0,0 +1,104 @@
+"""Выделение: маска и её ограничивающий прямоугольник.
+
+Маска (QImage Alpha8, 255 — пиксель выделен) хранится только в пределах
+bounds, поэтому её размер зависит от выделения, а не от холста.
+Операции над выделением работают внутри bounds: заливка и фильтры
+смешивают результат с прежними пикселями по маске, перо и ластик
+рисуют с обрезкой по region(), копирование вырезает bounds.
+"""
+
+from PyQt6.QtCore import QRect, QPoint, Qt
+from PyQt6.QtGui import QImage, QPainter, QPainterPath, QRegion, QBitmap
+
+from .floodfill import wand_mask
+
+MASK_FORMAT = QImage.Format.Format_Alpha8
+Mode = QPainter.CompositionMode
+
+
+class Selection:
+    def __init__(self, mask, bounds):
+        self.mask = mask
+        self.bounds = QRect(bounds)
+        self._region = None
+        self._outline = None
+
+    @classmethod
+    def from_rect(cls, rect, limit):
+        rect = rect.normalized().intersected(limit)
+        if rect.isEmpty():
+            return None
+        mask = QImage(rect.size(), MASK_FORMAT)
+        mask.fill(Qt.GlobalColor.black)
+        return cls(mask, rect)
+
+    @classmethod
+    def from_path(cls, path, limit):
+        # Лассо: замкнутый контур, заливка по правилу even-odd
+        rect = path.boundingRect().toAlignedRect().intersected(limit)
+        if rect.isEmpty():
+            return None
+        mask = QImage(rect.size(), MASK_FORMAT)
+        mask.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(mask)
+        painter.translate(-rect.x(), -rect.y())
+        painter.fillPath(path, Qt.GlobalColor.black)
+        painter.end()
+        return cls(mask, rect)
+
+    @classmethod
+    def from_wand(cls, tiles, pos, tolerance=0):
+        # Волшебная палочка: та же область, что залила бы заливка из pos
+        result = wand_mask(tiles, pos, tolerance)
+        return None if result is None else cls(*result)
+
+    def contains(self, pos):
+        if not self.bounds.contains(pos):
+            return False
+        return self.mask.pixel(pos - self.bounds.topLeft()) >> 24 != 0
+
+    def region(self):
+        """QRegion выделения в координатах изображения (для обрезки QPainter)."""
+        if self._region is None:
+            bitmap = QBitmap.fromImage(self.mask.createAlphaMask())
+            self._region = QRegion(bitmap).translated(self.bounds.topLeft())
+        return self._region
+
+    def outline(self):
+        # Контур для показа на холсте; считается один раз
+        if self._outline is None:
+            path = QPainterPath()
+            path.addRegion(self.region())
+            self._outline = path.simplified()
+        return self._outline
+
+    def cut(self, image):
+        """image (область bounds) с прозрачностью вне выделения."""
+        result = image.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+        painter = QPainter(result)
+        painter.setCompositionMode(Mode.CompositionMode_DestinationIn)
+        painter.drawImage(0, 0, self.mask)
+        painter.end()
+        return result
+
+    def blend(self, before, after):
+        """Смешивает две копии области bounds: внутри выделения — after,
+        снаружи — before."""
+        inside = self.cut(after)
+        outside = before.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+        painter = QPainter(outside)
+        painter.setCompositionMode(Mode.CompositionMode_DestinationOut)
+        painter.drawImage(0, 0, self.mask)
+        # Премультиплицированные значения складываются в точную смесь
+        painter.setCompositionMode(Mode.CompositionMode_Plus)
+        painter.drawImage(0, 0, inside)
+        painter.end()
+        return outside
+
+    def apply(self, tiles, image, point=QPoint(0, 0)):
+        """Записывает в tiles изменённое изображение image (его левый верхний
+        угол — point), но только пиксели внутри выделения."""
+        before = tiles.copy(self.bounds)
+        after = image.copy(self.bounds.translated(-point))
+        tiles.write(self.blend(before, after), self.bounds.topLeft())
+        return self.bounds
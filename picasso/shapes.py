@@ -0,0 +1,168 @@
+"""Векторные фигуры: квадрат, круг, линия, стрелка.
+
+Фигуры неизменяемы: перемещение создаёт новую фигуру на месте старой.
+ShapeIndex — сеточный пространственный индекс: поиск фигуры под курсором
+и перерисовка области смотрят только на фигуры из задетых ячеек.
+"""
+
+import math
+
+from PyQt6.QtCore import QPoint, QPointF, QRect
+from PyQt6.QtGui import QColor, QPainterPath, QPainterPathStroker, QPen
+
+SHAPES = ["square", "circle", "line", "arrow"]
+# Сторона ячейки пространственного индекса
+CELL = 128
+# Насколько можно промахнуться мимо контура фигуры при выборе
+HIT_TOLERANCE = 4
+
+
+def arrow_head(start, end, size=15):
+    # Концы двух «усов» наконечника стрелки
+    angle = math.atan2(start.y() - end.y(), start.x() - end.x())
+    return (
+        QPoint(int(end.x() + size * math.cos(angle + math.pi / 6)),
+               int(end.y() + size * math.sin(angle + math.pi / 6))),
+        QPoint(int(end.x() + size * math.cos(angle - math.pi / 6)),
+               int(end.y() + size * math.sin(angle - math.pi / 6))),
+    )
+
+
+def draw_shape(painter, tool, start, end):
+    rect = QRect(start, end).normalized()
+    if tool == "square":
+        painter.drawRect(rect)
+    elif tool == "circle":
+        painter.drawEllipse(rect)
+    elif tool == "line":
+        painter.drawLine(start, end)
+    elif tool == "arrow":
+        # Основная линия и наконечник стрелки
+        painter.drawLine(start, end)
+        arrow_p1, arrow_p2 = arrow_head(start, end)
+        painter.drawLine(end, arrow_p1)
+        painter.drawLine(end, arrow_p2)
+
+
+def shape_path(tool, start, end):
+    # Контур фигуры одним QPainterPath (для предпросмотра и выбора)
+    path = QPainterPath()
+    if tool == "square":
+        path.addRect(QRect(start, end).normalized().toRectF())
+    elif tool == "circle":
+        path.addEllipse(QRect(start, end).normalized().toRectF())
+    else:
+        path.moveTo(QPointF(start))
+        path.lineTo(QPointF(end))
+        if tool == "arrow":
+            for p in arrow_head(start, end):
+                path.moveTo(QPointF(end))
+                path.lineTo(QPointF(p))
+    return path
+
+
+def shape_bounds(tool, start, end, pen_size):
+    rect = QRect(start, end).normalized()
+    if tool == "arrow":
+        for p in arrow_head(start, end):
+            rect = rect.united(QRect(p, p))
+    return rect.adjusted(-pen_size, -pen_size, pen_size, pen_size)
+
+
+class Shape:
+    """Фигура: инструмент, два конца, цвет и толщина пера."""
+
+    __slots__ = ('tool', 'start', 'end', 'color', 'width', 'bounds')
+
+    def __init__(self, tool, start, end, color, width):
+        self.tool = tool
+        self.start = QPoint(start)
+        self.end = QPoint(end)
+        self.color = QColor(color)
+        self.width = width
+        self.bounds = shape_bounds(tool, self.start, self.end, width)
+
+    def moved(self, dx, dy):
+        offset = QPoint(dx, dy)
+        return Shape(self.tool, self.start + offset, self.end + offset, self.color, self.width)
+
+    def draw(self, painter):
+        painter.setPen(QPen(self.color, self.width))
+        draw_shape(painter, self.tool, self.start, self.end)
+
+    def hit(self, pos, tolerance=HIT_TOLERANCE):
+        # Точная проверка по контуру, обведённому пером толщины фигуры
+        if not self.bounds.adjusted(-tolerance, -tolerance, tolerance, tolerance).contains(pos):
+            return False
+        stroker = QPainterPathStroker()
+        stroker.setWidth(self.width + 2 * tolerance)
+        return stroker.createStroke(shape_path(self.tool, self.start, self.end)).contains(QPointF(pos))
+
+    def to_json(self):
+        return [self.tool, self.start.x(), self.start.y(), self.end.x(), self.end.y(),
+                self.color.rgba(), self.width]
+
+    @classmethod
+    def from_json(cls, data):
+        tool, x1, y1, x2, y2, rgba, width = data
+        return cls(tool, QPoint(x1, y1), QPoint(x2, y2), QColor.fromRgba(rgba), width)
+
+
+class ShapePreview:
+    """Резиновый контур рисуемой фигуры.
+
+    Перо создаётся один раз на фигуру, контур (с тригонометрией
+    наконечника) — один раз на движение мыши, а не на каждую перерисовку.
+    """
+
+    def __init__(self, tool, start, color, width):
+        self.tool = tool
+        self.start = QPoint(start)
+        self.pen = QPen(color, width)
+        self.path = QPainterPath()
+        self.bounds = QRect()
+
+    def move(self, end):
+        """Новый конец фигуры; возвращает область для перерисовки —
+        объединение прежних и новых границ."""
+        old = self.bounds
+        self.path = shape_path(self.tool, self.start, end)
+        w = self.pen.width()
+        self.bounds = self.path.controlPointRect().toAlignedRect().adjusted(-w, -w, w, w)
+        return old.united(self.bounds)
+
+    def draw(self, painter):
+        painter.setPen(self.pen)
+        painter.drawPath(self.path)
+
+
+class ShapeIndex:
+    """Сетка CELL x CELL: ячейка -> фигуры, чьи границы её задевают."""
+
+    def __init__(self):
+        self.cells = {}
+
+    def _cells(self, rect):
+        for cy in range(rect.top() // CELL, rect.bottom() // CELL + 1):
+            for cx in range(rect.left() // CELL, rect.right() // CELL + 1):
+                yield cx, cy
+
+    def add(self, shape):
+        for cell in self._cells(shape.bounds):
+            self.cells.setdefault(cell, set()).add(shape)
+
+    def remove(self, shape):
+        for cell in self._cells(shape.bounds):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.discard(shape)
+                if not bucket:
+                    del self.cells[cell]
+
+    def query(self, rect):
+        found = set()
+        for cell in self._cells(rect):
+            for shape in self.cells.get(cell, ()):
+                if shape.bounds.intersects(rect):
+                    found.add(shape)
+        return found
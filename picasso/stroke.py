@@ -0,0 +1,179 @@
+"""Штрих пера: сглаживание и рисование пачками.
+
+События мыши приходят чаще, чем кадры, поэтому точки штриха копятся
+и рисуются раз в кадр (FRAME_MS) одним QPainterPath. Через точки
+проводится сплайн Катмулла — Рома (как кубические кривые Безье),
+поэтому штрих получается гладким, а не ломаной.
+
+BrushStroke — кисть для планшета: штрих из отпечатков (dab), размер
+которых зависит от нажима и скорости пера. Отпечаток каждого размера,
+жёсткости и цвета рисуется один раз и берётся из кэша.
+"""
+
+import math
+import time
+from functools import lru_cache
+
+from PyQt6.QtCore import QPointF, QRect, Qt
+from PyQt6.QtGui import QPainterPath, QPen, QImage, QPainter, QColor, QRadialGradient
+
+from .tiles import FORMAT
+
+FRAME_MS = 16
+# Шаг между отпечатками кисти — доля диаметра
+SPACING = 0.15
+# Доля радиуса отпечатка, закрашенная без растушёвки
+HARDNESS = 0.7
+# Диаметр при самом слабом нажиме — доля размера пера
+MIN_PRESSURE_SIZE = 0.2
+# Скорость (пикселей в секунду), на которой кисть сужается вдвое
+HALF_SIZE_SPEED = 3000
+
+
+class Stroke:
+    """Один штрих на хранилище плиток tiles.
+
+    QPainter каждой задетой плитки открывается один раз и остаётся
+    открытым до finish(). bounds — прямоугольник всего штриха;
+    clip (QRegion) ограничивает штрих выделением.
+    """
+
+    def __init__(self, tiles, pen, start, composition=None, clip=None):
+        self.tiles = tiles
+        self.clip = clip
+        self.pen = pen
+        self.pen.setCapStyle(Qt.PenCapStyle.RoundCap)
+        self.pen.setJoinStyle(Qt.PenJoinStyle.RoundJoin)
+        self.composition = composition
+        self.painters = {}
+        self.bounds = QRect()
+        # Сегмент points[i] -> points[i + 1] рисуется, когда известны
+        # соседние точки; первая точка повторена как соседка начала
+        start = QPointF(start)
+        self.points = [start, start]
+
+    def add(self, point):
+        point = QPointF(point)
+        if point != self.points[-1]:
+            self.points.append(point)
+
+    def flush(self, final=False):
+        """Рисует накопленные сегменты; возвращает задетый прямоугольник
+        или None. final=True дорисовывает штрих до последней точки."""
+        points = self.points
+        if final:
+            points.append(points[-1])
+        if len(points) < 4:
+            return None
+        path = QPainterPath(points[1])
+        for i in range(1, len(points) - 2):
+            p0, p1, p2, p3 = points[i - 1:i + 3]
+            path.cubicTo(p1 + (p2 - p0) / 6, p2 - (p3 - p1) / 6, p2)
+        # Для продолжения нужны только две последние точки
+        del points[:-3]
+
+        w = self.pen.width()
+        rect = path.controlPointRect().toAlignedRect().adjusted(-w, -w, w, w)
+        for key in self.tiles.keys_in(rect):
+            self.painter(key).drawPath(path)
+        self.bounds = self.bounds.united(rect)
+        return rect
+
+    def painter(self, key):
+        painter = self.painters.get(key)
+        if painter is None:
+            painter = self.painters[key] = self.tiles.painter(key)
+            if self.composition is not None:
+                painter.setCompositionMode(self.composition)
+            if self.clip is not None:
+                painter.setClipRegion(self.clip)
+            painter.setPen(self.pen)
+        return painter
+
+    def finish(self):
+        rect = self.flush(final=True)
+        for painter in self.painters.values():
+            painter.end()
+        self.painters.clear()
+        return rect
+
+
+@lru_cache(maxsize=64)
+def dab(diameter, hardness, rgba):
+    """Отпечаток кисти: круг диаметра diameter, растушёванный от hardness к краю."""
+    image = QImage(diameter, diameter, FORMAT)
+    image.fill(Qt.GlobalColor.transparent)
+    color = QColor.fromRgba(rgba)
+    edge = QColor(color)
+    edge.setAlpha(0)
+    r = diameter / 2
+    gradient = QRadialGradient(QPointF(r, r), r)
+    gradient.setColorAt(0, color)
+    gradient.setColorAt(min(hardness, 0.99), color)
+    gradient.setColorAt(1, edge)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setPen(Qt.PenStyle.NoPen)
+    painter.setBrush(gradient)
+    painter.drawEllipse(image.rect())
+    painter.end()
+    return image
+
+
+class BrushStroke(Stroke):
+    """Штрих кисти из отпечатков через каждые SPACING диаметра.
+
+    add() только считает, где лягут отпечатки, — это дёшево даже
+    для 1000 событий в секунду; рисует их пачкой flush().
+    """
+
+    def __init__(self, tiles, color, size, start, pressure, hardness=HARDNESS, spacing=SPACING, clip=None):
+        super().__init__(tiles, QPen(color, size), start, clip=clip)
+        self.rgba = QColor(color).rgba()
+        self.size = size
+        self.hardness = hardness
+        self.spacing = spacing
+        self.last = QPointF(start), pressure, time.monotonic()
+        self.speed = 0.0
+        # Путь от последнего отпечатка, ещё не дошедший до следующего
+        self.residue = 0.0
+        self.dabs = [(QPointF(start), self.diameter(pressure))]
+
+    def diameter(self, pressure):
+        pressure = MIN_PRESSURE_SIZE + (1 - MIN_PRESSURE_SIZE) * pressure
+        return max(1, round(self.size * pressure / (1 + self.speed / HALF_SIZE_SPEED)))
+
+    def add(self, point, pressure=1.0):
+        point = QPointF(point)
+        start, start_pressure, start_time = self.last
+        now = time.monotonic()
+        delta = point - start
+        distance = math.hypot(delta.x(), delta.y())
+        if distance == 0:
+            return
+        # Сглаженная скорость, чтобы размер не дёргался от события к событию
+        self.speed += 0.3 * (distance / max(now - start_time, 1e-3) - self.speed)
+        self.last = point, pressure, now
+        step = max(1.0, self.size * self.spacing)
+        t = step - self.residue
+        while t <= distance:
+            k = t / distance
+            self.dabs.append((start + delta * k,
+                              self.diameter(start_pressure + (pressure - start_pressure) * k)))
+            t += step
+        self.residue = distance - (t - step)
+
+    def flush(self, final=False):
+        if not self.dabs:
+            return None
+        rect = QRect()
+        for center, diameter in self.dabs:
+            image = dab(diameter, self.hardness, self.rgba)
+            corner = center - QPointF(diameter / 2, diameter / 2)
+            area = QRect(math.floor(corner.x()), math.floor(corner.y()), diameter + 1, diameter + 1)
+            for key in self.tiles.keys_in(area):
+                self.painter(key).drawImage(corner, image)
+            rect = rect.united(area)
+        self.dabs.clear()
+        self.bounds = self.bounds.united(rect)
+        return rect
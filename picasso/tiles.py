@@ -0,0 +1,211 @@
+"""Плиточное хранилище холста: изображение из плиток 256x256.
+
+Плитки создаются лениво, при первом рисовании; отсутствующая плитка
+означает сплошной фон и не занимает памяти. Хранилище само запоминает
+состояние плиток до текущей операции, поэтому история отмены и
+сохранение работают только с изменёнными плитками.
+
+Плитка может быть и отложенной (sources): тогда она декодируется
+из файла проекта при первом обращении.
+"""
+
+from PyQt6.QtCore import QRect, QPoint, QSize, Qt
+from PyQt6.QtGui import QImage, QPainter, QColor
+
+TILE = 256
+FORMAT = QImage.Format.Format_ARGB32_Premultiplied
+
+
+class TiledImage:
+    def __init__(self, width, height, background=Qt.GlobalColor.white):
+        self._size = QSize(width, height)
+        self.background = QColor(background)
+        self.tiles = {}
+        # Ещё не прочитанные плитки: ключ -> вызываемый объект
+        # source(register), отдающий QImage (см. snapshot)
+        self.sources = {}
+        # Плитки до начала текущей операции: ключ -> QImage или None
+        self.pending = {}
+        self.pending_size = None
+        # False — хранилище служит кэшем (растр слоя фигур)
+        # и не запоминает плитки для истории отмены
+        self.track_changes = True
+        # Снимок читает плитки в фоновом потоке (см. snapshot)
+        self.is_snapshot = False
+
+    @classmethod
+    def from_image(cls, image, background=Qt.GlobalColor.white, progress=None):
+        # progress(готово_рядов, всего_рядов) вызывается после каждого ряда
+        # плиток; если он вернёт False, разбиение прерывается и результат None
+        tiles = cls(image.width(), image.height(), background)
+        image = image.convertToFormat(FORMAT)
+        rows = (image.height() + TILE - 1) // TILE
+        for key in tiles.keys_in(tiles.rect()):
+            tiles.tiles[key] = image.copy(tiles.tile_rect(key))
+            if progress is not None and (key[0] + 1) * TILE >= image.width():
+                if progress(key[1] + 1, rows) is False:
+                    return None
+        return tiles
+
+    def size(self):
+        return QSize(self._size)
+
+    def width(self):
+        return self._size.width()
+
+    def height(self):
+        return self._size.height()
+
+    def rect(self):
+        return QRect(QPoint(0, 0), self._size)
+
+    def nbytes(self):
+        return len(self.tiles) * TILE * TILE * 4
+
+    def keys(self):
+        # Ключи всех непустых плиток, в том числе ещё не прочитанных
+        return self.tiles.keys() | self.sources.keys()
+
+    def keys_in(self, rect):
+        rect = rect.intersected(self.rect())
+        if rect.isEmpty():
+            return
+        for ty in range(rect.top() // TILE, rect.bottom() // TILE + 1):
+            for tx in range(rect.left() // TILE, rect.right() // TILE + 1):
+                yield tx, ty
+
+    def tile_rect(self, key):
+        return QRect(key[0] * TILE, key[1] * TILE, TILE, TILE)
+
+    def tile(self, key, create=False):
+        # create=True — плитка будет изменена: запоминаем её прежнее
+        # состояние и при необходимости выделяем память
+        if not create:
+            return self._get(key)
+        self._touch(key)
+        tile = self._get(key)
+        if tile is None:
+            tile = QImage(TILE, TILE, FORMAT)
+            tile.fill(self.background)
+            self.tiles[key] = tile
+        return tile
+
+    def _get(self, key):
+        tile = self.tiles.get(key)
+        if tile is None and key in self.sources:
+            tile = self.tiles[key] = self.sources.pop(key)(not self.is_snapshot)
+        return tile
+
+    def _touch(self, key):
+        if self.track_changes and key not in self.pending:
+            tile = self._get(key)
+            # Копия разделяет данные с плиткой и отделится при записи
+            self.pending[key] = None if tile is None else QImage(tile)
+
+    def painter(self, key):
+        # QPainter на плитке в координатах всего изображения
+        painter = QPainter(self.tile(key, create=True))
+        painter.translate(-key[0] * TILE, -key[1] * TILE)
+        return painter
+
+    def paint(self, rect, draw):
+        # Вызывает draw(painter) для каждой плитки, задетой rect
+        for key in list(self.keys_in(rect)):
+            painter = self.painter(key)
+            draw(painter)
+            painter.end()
+
+    def draw(self, painter, rect, target=None):
+        # Рисует область rect изображения; target — куда (по умолчанию туда же)
+        rect = rect.intersected(self.rect())
+        offset = QPoint(0, 0) if target is None else target - rect.topLeft()
+        for key in self.keys_in(rect):
+            area = self.tile_rect(key).intersected(rect)
+            tile = self._get(key)
+            if tile is None:
+                painter.fillRect(area.translated(offset), self.background)
+            else:
+                source = area.translated(-key[0] * TILE, -key[1] * TILE)
+                painter.drawImage(area.translated(offset), tile, source)
+
+    def copy(self, rect=None):
+        rect = self.rect() if rect is None else rect.intersected(self.rect())
+        image = QImage(rect.size(), FORMAT)
+        painter = QPainter(image)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        self.draw(painter, rect, QPoint(0, 0))
+        painter.end()
+        return image
+
+    def to_image(self):
+        return self.copy()
+
+    def snapshot(self):
+        # Неизменяемая копия для фоновых задач: плитки разделяют данные
+        # с оригиналом и копируются только при последующей записи.
+        # Источники снимка вызываются с register=False: плитка нужна
+        # только снимку, и источник не должен её запоминать
+        snap = TiledImage(self.width(), self.height(), self.background)
+        snap.is_snapshot = True
+        snap.tiles = {key: QImage(tile) for key, tile in self.tiles.items()}
+        snap.sources = dict(self.sources)
+        return snap
+
+    def write(self, image, point, rect=None):
+        # Копирует image в позицию point; rect ограничивает записываемую
+        # область (в координатах холста)
+        area = QRect(point, image.size())
+        if rect is not None:
+            area = area.intersected(rect)
+
+        def draw(painter):
+            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+            painter.drawImage(area, image, area.translated(-point))
+        self.paint(area, draw)
+
+    def pixel_color(self, pos):
+        tile = self._get((pos.x() // TILE, pos.y() // TILE))
+        if tile is None:
+            return QColor(self.background)
+        return tile.pixelColor(pos.x() % TILE, pos.y() % TILE)
+
+    def clear(self):
+        for key in list(self.keys()):
+            self._touch(key)
+        self.tiles.clear()
+        self.sources.clear()
+
+    def replace(self, other):
+        # Заменяет содержимое и размер на other как одну операцию
+        for key in list(self.keys() | other.keys()):
+            self._touch(key)
+        if self.pending_size is None:
+            self.pending_size = self.size()
+        self._size = other.size()
+        self.tiles = dict(other.tiles)
+        self.sources = dict(other.sources)
+
+    def take_changes(self):
+        """Забирает накопленные изменения: (прежний размер или None, {ключ: плитка})."""
+        size, pending = self.pending_size, self.pending
+        self.pending, self.pending_size = {}, None
+        return size, pending
+
+    def restore(self, size, tiles):
+        """Возвращает плитки (и размер) к сохранённым; отдаёт обратный шаг."""
+        inverse = {key: self._get(key) for key in tiles}
+        old_size = None
+        if size is not None:
+            old_size, self._size = self.size(), QSize(size)
+        for key, tile in tiles.items():
+            if tile is None:
+                self.tiles.pop(key, None)
+            else:
+                self.tiles[key] = tile
+        return old_size, inverse
+
+    def changed_rect(self, keys):
+        rect = QRect()
+        for key in keys:
+            rect = rect.united(self.tile_rect(key))
+        return rect.intersected(self.rect())
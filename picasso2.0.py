@@ -1,209 +1,494 @@
+import time
+
+# Момент старта процесса: от него отсчитываются метки запуска
+START_TIME = time.perf_counter()
+
 import sys
+import os
 import math
 from PyQt6.QtWidgets import QComboBox
 from PyQt6 import QtWidgets, QtCore
-from PyQt6.QtCore import QSize, Qt, QRect, QPoint
-from PyQt6.QtGui import QIcon, QAction, QColor, QPixmap, QPainter, QImage, QPen, QShortcut, QKeySequence, QFontDatabase
+from PyQt6.QtCore import QSize, Qt, QPoint, QPointF, QRectF, QTimer, QEvent
+from PyQt6.QtGui import QAction, QColor, QPixmap, QPainter, QImage, QPen, QShortcut, QKeySequence, \
+    QFont, QFontMetrics, QPainterPath
 from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QLabel, \
-   QGraphicsColorizeEffect, QToolBar, QSlider, QWidget, QVBoxLayout, QHBoxLayout, QFileDialog, QColorDialog
+   QGraphicsColorizeEffect, QToolBar, QSlider, QWidget, QVBoxLayout, QHBoxLayout, QFileDialog, QColorDialog, \
+   QScrollArea, QProgressDialog, QMessageBox, QDockWidget, QListWidget, QListWidgetItem, QDialog, \
+   QDialogButtonBox, QFormLayout
+
+from picasso.floodfill import fill_tiles
+from picasso.history import UndoHistory
+from picasso.tiles import TiledImage
+from picasso.layers import Document, ShapeLayer, BLEND_MODES
+from picasso.mipmap import MipCache
+from picasso.loader import ImageLoader
+from picasso.saver import ImageSaver, DEFAULT_COMPRESSION
+from picasso.journal import Journal
+from picasso.project import Project, PROJECT_EXT
+from picasso.shapes import SHAPES, Shape, ShapePreview
+from picasso.stroke import Stroke, BrushStroke, FRAME_MS
+from picasso.selection import Selection
+from picasso import filters
+from picasso.filters import FILTERS, FilterRunner, preview_proxy
+from picasso.fonts import families
+from picasso.icons import icon
+
+# Память под историю отмены; старые шаги сжимаются и выгружаются на диск
+UNDO_BUDGET_MB = 256
+
+MIN_ZOOM, MAX_ZOOM = 1 / 32, 32
+ZOOM_STEP = 1.25
+
+SELECT_TOOLS = ["select_rect", "lasso", "wand"]
+
+
+class StartupTrace(QtCore.QObject):
+    """Метки времени запуска от START_TIME до первой отрисовки холста.
+
+    Итог печатается, если задана переменная окружения PICASSO_STARTUP_TRACE.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.marks = []
+        self.enabled = bool(os.environ.get('PICASSO_STARTUP_TRACE'))
+
+    def mark(self, label):
+        self.marks.append((label, time.perf_counter() - START_TIME))
+
+    def watch_first_paint(self, widget):
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, e):
+        if e.type() == QEvent.Type.Paint:
+            obj.removeEventFilter(self)
+            # Метка — после того как кадр дорисован
+            QTimer.singleShot(0, self.first_paint)
+        return False
+
+    def first_paint(self):
+        self.mark("первый кадр")
+        if self.enabled:
+            print("⏱ Запуск: " + ", ".join(f"{label} {t * 1000:.0f} мс" for label, t in self.marks))
 
 
-class Canvas(QLabel):
+startup = StartupTrace()
+startup.mark("импорт")
+
+
+class Canvas(QWidget):
     def __init__(self, main_window):
         super().__init__(main_window)
         self.main_window = main_window
-
-        self.history = []
-        self.future = []
-
-        pixmap = QPixmap(800, 500)
-        pixmap.fill(Qt.GlobalColor.white)
-        self.setPixmap(pixmap)
+        # Холст сам закрашивает всё, что показывает
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
+
+        # Изображение — стопка слоёв из плиток: память и перерисовка зависят
+        # от видимой и изменённой области, а не от размера картинки.
+        # Инструменты рисуют в активный слой, на экран идёт кэш композиции
+        self.doc = Document(800, 500)
+        self.history = UndoHistory(self.doc, budget_mb=UNDO_BUDGET_MB)
+        # Уменьшенные копии итоговых плиток для отрисовки при отдалении
+        self.mips = MipCache(self.doc)
+        self.zoom = 1.0
+        # Точка (в глобальных координатах), от которой тянем холст средней кнопкой
+        self.pan_origin = None
+        self.fit_to_zoom()
         self.tool = "pen"
 
         self.last_x, self.last_y = None, None
         self.pen_color = QColor('#000000')
         self.pen_size = 4
         self.eraser = False
+        self.fill_tolerance = 0
+        # Сторона квадрата, по которому пипетка усредняет цвет (1, 3, 5)
+        self.picker_size = 1
+
+        # Контур рисуемой фигуры, пока её тянут мышью
+        self.preview = None
+        # Текущий штрих пера; его точки рисуются раз в кадр
+        self.stroke = None
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.setInterval(FRAME_MS)
+        self.frame_timer.timeout.connect(self.flush_stroke)
+        # Выбранная фигура: (слой, фигура); при перетаскивании — фигура
+        # до начала перетаскивания и точка, где нажали
+        self.selection = None
+        self.drag = None
+        # Выделенная область (Selection) и её контур, пока его тянут мышью
+        self.selected_area = None
+        self.marquee = None
+
+    def set_image(self, image):
+        self.set_document(Document.from_tiles(TiledImage.from_image(image)))
+
+    def set_document(self, doc):
+        # Новое изображение заменяет холст одним шагом истории
+        self.end_stroke()
+        self.set_area(None)
+        self.doc.replace(doc)
+        self.fit_to_zoom()
+        self.changed()
+        self.save_state()
+        self.main_window.refresh_layers()
+
+    def set_project(self, doc, undo, redo):
+        # Проект приходит вместе со своей историей, поэтому открытие
+        # не становится шагом отмены
+        self.end_stroke()
+        self.set_area(None)
+        self.doc.replace(doc)
+        self.history.reset(undo, redo)
+        self.fit_to_zoom()
+        self.changed()
+        self.main_window.refresh_layers()
+
+    def fit_to_zoom(self):
+        self.setFixedSize(math.ceil(self.doc.width() * self.zoom),
+                          math.ceil(self.doc.height() * self.zoom))
+
+    def set_zoom(self, zoom, anchor=None):
+        # anchor — точка виджета, которая должна остаться под курсором
+        zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+        if zoom == self.zoom:
+            return
+        scroll = self.main_window.scroll
+        if anchor is None:
+            viewport = scroll.viewport().rect().center()
+            anchor = QPointF(self.mapFrom(scroll.viewport(), viewport))
+        old, self.zoom = self.zoom, zoom
+        self.fit_to_zoom()
+        shift = anchor * (zoom / old) - anchor
+        scroll.horizontalScrollBar().setValue(scroll.horizontalScrollBar().value() + round(shift.x()))
+        scroll.verticalScrollBar().setValue(scroll.verticalScrollBar().value() + round(shift.y()))
+        self.update()
 
-        self.temp_end_point = None
+    def to_image(self, pos):
+        # Координаты виджета -> координаты изображения
+        return pos / self.zoom
+
+    @staticmethod
+    def pixel(pos):
+        # Пиксель изображения, в который попадает точка pos (координаты
+        # изображения): округление вниз, иначе при увеличении правая
+        # и нижняя половины экранного пикселя попадали бы в соседний
+        return QPoint(math.floor(pos.x()), math.floor(pos.y()))
+
+    def changed(self, rect=None):
+        # Область изображения изменилась: сбрасываем её композицию
+        # и mip-уровни и перерисовываем прямоугольник виджета
+        self.doc.invalidate(rect)
+        self.mips.invalidate(rect)
+        if rect is None:
+            self.update()
+            return
+        self.update_area(rect)
 
-        self.save_state()
+    def update_area(self, rect):
+        # Перерисовка прямоугольника изображения без сброса кэшей:
+        # под ним просто копируются готовые плитки
+        z = self.zoom
+        self.update(QRectF(rect.x() * z, rect.y() * z, rect.width() * z, rect.height() * z)
+                    .toAlignedRect().adjusted(-1, -1, 1, 1))
 
     def save_state(self):
-        self.history.append(self.pixmap().copy())
-        if len(self.history) > 20:
-            self.history.pop(0)
-        self.future.clear()
+        self.history.commit()
 
     def undo(self):
-        if len(self.history) > 1:
-            self.future.append(self.history.pop())
-            self.setPixmap(self.history[-1])
+        self.end_stroke()
+        self.restore(self.history.undo())
 
     def redo(self):
-        if self.future:
-            self.history.append(self.future.pop())
-            self.setPixmap(self.history[-1])
+        self.end_stroke()
+        self.restore(self.history.redo())
+
+    def restore(self, rect):
+        if rect is None:
+            return
+        self.fit_to_zoom()
+        self.changed(rect)
+        self.main_window.refresh_layers()
 
     def set_pen_color(self, c):
         self.pen_color = QColor(c)
 
+    def raster_tiles(self, warn=True):
+        # Плитки активного слоя для растровых инструментов. В слое фигур
+        # они лишь кэш отрисовки фигур и не сохраняются, поэтому туда
+        # не рисуем
+        layer = self.doc.layer()
+        if isinstance(layer, ShapeLayer):
+            if warn:
+                print("❌ Активен слой фигур: для рисования выберите обычный слой")
+            return None
+        return layer.tiles
+
     def fill_color(self, color, pos):
-        pixmap = self.pixmap()
-        if pixmap is None:
-            print("❌ Нет pixmap!")
+        tiles = self.raster_tiles()
+        if tiles is None:
             return
-
-        img = QImage(pixmap.toImage())
-        if not QRect(0, 0, img.width(), img.height()).contains(pos):
+        if not tiles.rect().contains(pos):
             print(f"❌ Позиция вне изображения: {pos}")
             return
+        area = self.selected_area
+        if area is not None and not area.contains(pos):
+            print("❌ Позиция вне выделения")
+            return
 
-        target_color = img.pixelColor(pos)
-        if target_color.rgba() == color.rgba():
+        target_color = tiles.pixel_color(pos)
+        if self.fill_tolerance <= 0 and target_color.rgba() == color.rgba():
             print("🎨 Цвет совпадает, заливка не нужна")
             return
 
-        painter = QPainter(pixmap)
-        painter.setPen(QPen(color))
-
-        stack = [(pos.x(), pos.y())]
-        checked = set()
-
-        while stack:
-            x, y = stack.pop()
-            if (x, y) in checked:
-                continue
-            checked.add((x, y))
-
-            if img.pixelColor(x, y).rgba() == target_color.rgba():
-                painter.drawPoint(x, y)
-                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    nx, ny = x + dx, y + dy
-                    if 0 <= nx < img.width() and 0 <= ny < img.height():
-                        stack.append((nx, ny))
-
-        painter.end()
-        self.setPixmap(pixmap)
+        rect = fill_tiles(tiles, pos, color, self.fill_tolerance, area)
+        if rect is None:
+            return
+        self.changed(rect)
         self.save_state()
 
     def clear(self):
-        new_pixmap = QPixmap(self.width(), self.height())
-        new_pixmap.fill(Qt.GlobalColor.white)
-        self.setPixmap(new_pixmap)
+        self.end_stroke()
+        self.doc.clear()
+        self.changed()
         self.save_state()
+        self.main_window.refresh_layers()
+
+    def selected_shape(self):
+        # Выбор мог устареть после отмены или удаления слоя
+        if self.selection is None:
+            return None
+        layer, shape = self.selection
+        if layer not in self.doc.layers or shape not in layer.order:
+            self.selection = None
+            return None
+        return self.selection
+
+    def select_shape(self, pos):
+        old = self.selected_shape()
+        self.selection = self.doc.shape_at(pos)
+        for hit in (old, self.selection):
+            if hit is not None:
+                self.changed(hit[1].bounds)
+        if self.selection is not None:
+            self.doc.active = self.doc.layers.index(self.selection[0])
+            self.main_window.refresh_layers()
+
+    def move_selection(self, pos):
+        layer, shape = self.selection
+        original, origin = self.drag
+        moved = original.moved(round(pos.x() - origin.x()), round(pos.y() - origin.y()))
+        self.selection = layer, moved
+        self.changed(self.doc.replace_shape(layer, shape, moved))
+
+    def delete_selection(self):
+        # Выбранная фигура удаляется, а выделенная область стирается до фона слоя
+        selection = self.selected_shape()
+        if selection is not None:
+            self.selection = None
+            self.changed(self.doc.remove_shape(*selection))
+            self.save_state()
+        elif self.selected_area is not None:
+            area, tiles = self.selected_area, self.raster_tiles()
+            if tiles is None:
+                return
+            img = QImage(area.bounds.size(), QImage.Format.Format_ARGB32_Premultiplied)
+            img.fill(tiles.background)
+            self.changed(area.apply(tiles, img, area.bounds.topLeft()))
+            self.save_state()
+
+    def set_area(self, area):
+        # Новое выделение (или None — снять выделение)
+        for old in (self.selected_area, area):
+            if old is not None:
+                self.update_area(old.bounds)
+        self.selected_area = area
+
+    def clip(self):
+        return None if self.selected_area is None else self.selected_area.region()
+
+    def select_area(self, pos):
+        # Выделение по контуру marquee или волшебной палочкой из pos
+        limit = self.doc.rect()
+        if self.tool == "wand":
+            if not limit.contains(pos):
+                return
+            area = Selection.from_wand(self.doc.layer().tiles, pos, self.fill_tolerance)
+        elif self.tool == "select_rect":
+            area = Selection.from_rect(self.marquee.boundingRect().toAlignedRect(), limit)
+        else:
+            self.marquee.closeSubpath()
+            area = Selection.from_path(self.marquee, limit)
+        self.set_area(area)
+
+    def flush_stroke(self):
+        if self.stroke is not None:
+            rect = self.stroke.flush()
+            if rect is not None:
+                self.changed(rect)
+
+    def end_stroke(self):
+        # Дорисовывает штрих до последней точки; шаг истории
+        # фиксирует вызывающий (save_state)
+        self.frame_timer.stop()
+        if self.stroke is not None:
+            rect = self.stroke.finish()
+            self.stroke = None
+            if rect is not None:
+                self.changed(rect)
 
     def paintEvent(self, event):
-        super().paintEvent(event)
-        if self.tool in ["square", "circle", "line", "arrow"] and self.temp_end_point:
-            painter = QPainter(self)
-            p = painter.pen()
-            p.setWidth(self.pen_size)
-            p.setColor(self.pen_color)
-            painter.setPen(p)
-
-            start = QPoint(int(self.last_x), int(self.last_y))
-            end = self.temp_end_point
-            rect = QRect(start, end).normalized()
-
-            if self.tool == "square":
-                painter.drawRect(rect)
-            elif self.tool == "circle":
-                painter.drawEllipse(rect)
-            elif self.tool == "line":
-                painter.drawLine(start, end)
-            elif self.tool == "arrow":
-                painter.drawLine(start, end)
-                angle = math.atan2(start.y() - end.y(), start.x() - end.x())
-                arrow_size = 15
-                arrow_p1 = QPoint(
-                    int(end.x() + arrow_size * math.cos(angle + math.pi / 6)),
-                    int(end.y() + arrow_size * math.sin(angle + math.pi / 6))
-                )
-                arrow_p2 = QPoint(
-                    int(end.x() + arrow_size * math.cos(angle - math.pi / 6)),
-                    int(end.y() + arrow_size * math.sin(angle - math.pi / 6))
-                )
-                painter.drawLine(end, arrow_p1)
-                painter.drawLine(end, arrow_p2)
+        painter = QPainter(self)
+        # Рисуются только плитки, попавшие в видимую область
+        self.mips.draw(painter, event.rect(), self.zoom)
+        if self.preview is not None:
+            painter.scale(self.zoom, self.zoom)
+            self.preview.draw(painter)
+        if self.marquee is not None or self.selected_area is not None:
+            painter.resetTransform()
+            painter.scale(self.zoom, self.zoom)
+            # Косметическое перо — в один пиксель экрана при любом масштабе
+            pen = QPen(QColor('#000000'), 0, Qt.PenStyle.DashLine)
+            painter.setPen(pen)
+            for path in (self.marquee, self.selected_area and self.selected_area.outline()):
+                if path is not None:
+                    painter.drawPath(path)
+        selection = self.selected_shape()
+        if selection is not None:
+            painter.resetTransform()
+            painter.setPen(QPen(QColor('#3080ff'), 1, Qt.PenStyle.DashLine))
+            b = selection[1].bounds
+            z = self.zoom
+            painter.drawRect(QRectF(b.x() * z, b.y() * z, b.width() * z - 1, b.height() * z - 1))
+
+    def tabletEvent(self, e) -> None:
+        # Перо планшета рисует кистью с нажимом; ластик и другие
+        # инструменты получают обычные события мыши, которые Qt
+        # создаст из непринятых событий планшета
+        if self.tool != "pen" or self.eraser:
+            e.ignore()
+            return
+        pos = self.to_image(e.position())
+        if e.type() == QEvent.Type.TabletPress:
+            self.end_stroke()
+            tiles = self.raster_tiles()
+            if tiles is None:
+                return
+            self.stroke = BrushStroke(tiles, self.pen_color, self.pen_size, pos, e.pressure(),
+                                      clip=self.clip())
+            if not self.frame_timer.isActive():
+                self.frame_timer.start()
+        elif e.type() == QEvent.Type.TabletMove and isinstance(self.stroke, BrushStroke):
+            self.stroke.add(pos, e.pressure())
+            if not self.frame_timer.isActive():
+                self.frame_timer.start()
+        elif e.type() == QEvent.Type.TabletRelease and isinstance(self.stroke, BrushStroke):
+            self.end_stroke()
+            self.save_state()
+        e.accept()
+
+    def wheelEvent(self, e) -> None:
+        if e.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            self.set_zoom(self.zoom * ZOOM_STEP ** (e.angleDelta().y() / 120), e.position())
+        else:
+            e.ignore()
+
+    def mousePressEvent(self, e) -> None:
+        if e.button() == Qt.MouseButton.MiddleButton:
+            self.pan_origin = e.globalPosition()
+            self.setCursor(Qt.CursorShape.ClosedHandCursor)
+        elif e.button() == Qt.MouseButton.LeftButton and self.tool == "select":
+            pos = self.to_image(e.position())
+            self.select_shape(self.pixel(pos))
+            if self.selection is not None:
+                self.drag = self.selection[1], pos
+        elif e.button() == Qt.MouseButton.LeftButton and self.tool in ("select_rect", "lasso"):
+            self.marquee = QPainterPath(self.to_image(e.position()))
 
     def mouseMoveEvent(self, e) -> None:
-        if self.last_x is None:
-            self.last_x = e.position().x()
-            self.last_y = e.position().y()
+        if self.pan_origin is not None:
+            delta = e.globalPosition() - self.pan_origin
+            self.pan_origin = e.globalPosition()
+            scroll = self.main_window.scroll
+            scroll.horizontalScrollBar().setValue(scroll.horizontalScrollBar().value() - round(delta.x()))
+            scroll.verticalScrollBar().setValue(scroll.verticalScrollBar().value() - round(delta.y()))
+            return
+
+        pos = self.to_image(e.position())
+        pressed = self.last_x is None
+        if pressed:
+            self.last_x = pos.x()
+            self.last_y = pos.y()
         if self.tool == "pen":
-            canvas = self.pixmap()
-            painter = QPainter(canvas)
-            p = painter.pen()
-            p.setWidth(self.pen_size)
-            p.setColor(QColor("#FFFFFF") if self.eraser else self.pen_color)
-            painter.setPen(p)
-            painter.drawLine(int(self.last_x),
-                             int(self.last_y),
-                             int(e.position().x()),
-                             int(e.position().y()))
-            painter.end()
-            self.setPixmap(canvas)
-            self.last_x = e.position().x()
-            self.last_y = e.position().y()
-        elif self.tool in ["square", "circle", "line", "arrow"]:
-            self.temp_end_point = e.position().toPoint()
-            self.update()
+            if self.stroke is None:
+                # Предупреждение — один раз за движение, а не на каждое событие
+                tiles = self.raster_tiles(warn=pressed)
+                if tiles is None:
+                    return
+                if self.eraser:
+                    # Ластик возвращает фон слоя (на верхних слоях — прозрачность)
+                    self.stroke = Stroke(tiles, QPen(tiles.background, self.pen_size), pos,
+                                         QPainter.CompositionMode.CompositionMode_Source, self.clip())
+                else:
+                    self.stroke = Stroke(tiles, QPen(self.pen_color, self.pen_size), pos, clip=self.clip())
+            self.stroke.add(pos)
+            # Все события до следующего кадра рисуются одной пачкой
+            if not self.frame_timer.isActive():
+                self.frame_timer.start()
+            self.last_x = pos.x()
+            self.last_y = pos.y()
+        elif self.tool in SHAPES:
+            if self.preview is None:
+                self.preview = ShapePreview(self.tool, self.pixel(QPointF(self.last_x, self.last_y)),
+                                            self.pen_color, self.pen_size)
+            self.update_area(self.preview.move(self.pixel(pos)))
+        elif self.tool == "select" and self.drag is not None:
+            self.move_selection(pos)
+        elif self.marquee is not None:
+            old = self.marquee.boundingRect()
+            if self.tool == "select_rect":
+                start = self.marquee.elementAt(0)
+                self.marquee = QPainterPath(QPointF(start.x, start.y))
+                self.marquee.addRect(QRectF(QPointF(start.x, start.y), pos).normalized())
+            else:
+                self.marquee.lineTo(pos)
+            self.update_area(old.united(self.marquee.boundingRect()).toAlignedRect())
 
     def mouseReleaseEvent(self, e) -> None:
-        pos = e.position().toPoint()
+        if e.button() == Qt.MouseButton.MiddleButton:
+            self.pan_origin = None
+            self.unsetCursor()
+            return
+
+        pos = self.pixel(self.to_image(e.position()))
+        self.end_stroke()
 
         if self.tool == "can":
             self.fill_color(self.pen_color, pos)
 
-        elif self.tool in ["square", "circle", "line", "arrow"]:
-            canvas = self.pixmap()
-            painter = QPainter(canvas)
-            p = painter.pen()
-            p.setWidth(self.pen_size)
-            p.setColor(self.pen_color)
-            painter.setPen(p)
-
-            start = QPoint(int(self.last_x), int(self.last_y))
-            end = e.position().toPoint()
-
-            rect = QRect(start, end).normalized()
-
-            if self.tool == "square":
-                painter.drawRect(rect)
-            elif self.tool == "circle":
-                painter.drawEllipse(rect)
-            elif self.tool == "line":
-                painter.drawLine(start, end)
-            elif self.tool == "arrow":
-                # Рисуем основную линию стрелки
-                painter.drawLine(start, end)
-
-                # Рисуем наконечник стрелки
-                angle = math.atan2(start.y() - end.y(), start.x() - end.x())
-                arrow_size = 15  # Размер наконечника
-
-                arrow_p1 = QPoint(
-                    int(end.x() + arrow_size * math.cos(angle + math.pi / 6)),
-                    int(end.y() + arrow_size * math.sin(angle + math.pi / 6))
-                )
-                arrow_p2 = QPoint(
-                    int(end.x() + arrow_size * math.cos(angle - math.pi / 6)),
-                    int(end.y() + arrow_size * math.sin(angle - math.pi / 6))
-                )
-
-                painter.drawLine(end, arrow_p1)
-                painter.drawLine(end, arrow_p2)
-
-            painter.end()
-            self.setPixmap(canvas)
+        elif self.tool in SELECT_TOOLS:
+            if self.tool == "wand" or self.marquee is not None:
+                self.select_area(pos)
+            if self.marquee is not None:
+                self.update_area(self.marquee.boundingRect().toAlignedRect())
+                self.marquee = None
+
+        elif self.tool in SHAPES:
+            # Фигура остаётся вектором в слое фигур
+            start = self.pixel(QPointF(self.last_x, self.last_y))
+            count = len(self.doc.layers)
+            self.changed(self.doc.add_shape(Shape(self.tool, start, pos, self.pen_color, self.pen_size)))
+            self.save_state()
+            if len(self.doc.layers) != count:
+                self.main_window.refresh_layers()
+
+        elif self.tool == "select":
+            self.drag = None
             self.save_state()
 
         elif self.tool == "picker":
-            img = self.pixmap().toImage()
-            if QRect(0, 0, img.width(), img.height()).contains(pos):
-                picked_color = img.pixelColor(pos)
+            picked_color = self.doc.average_color(pos, self.picker_size)
+            if picked_color is not None:
                 hex_color = picked_color.name()
 
                 self.main_window.set_current_color(hex_color)
@@ -212,27 +497,71 @@ class Canvas(QLabel):
 
                 self.main_window.pen_pressed()
 
-        elif self.tool == "text":
+        elif self.tool == "text" and self.raster_tiles() is not None:
             text, ok = QtWidgets.QInputDialog.getText(self, "Введите текст", "Текст:")
             if ok and text:
-                canvas = self.pixmap()
-                painter = QPainter(canvas)
-                painter.setPen(QPen(self.pen_color))
-                font = painter.font()
-                font.setFamily(self.main_window.fontComboBox.currentFont().family())
+                font = QFont()
+                font.setFamily(self.main_window.fontComboBox.currentText())
                 font.setPointSize(int(self.main_window.fontSizeComboBox.currentText()))
-                painter.setFont(font)
-                painter.drawText(pos, text)
-                painter.end()
-                self.setPixmap(canvas)
+                color = self.pen_color
+                # Метрики считаем для QImage, на котором текст и будет нарисован
+                metrics = QFontMetrics(font, QImage(1, 1, QImage.Format.Format_ARGB32_Premultiplied))
+                rect = metrics.boundingRect(text).translated(pos).adjusted(-2, -2, 2, 2)
+
+                def draw(painter):
+                    painter.setPen(QPen(color))
+                    painter.setFont(font)
+                    painter.drawText(pos, text)
+                self.doc.layer().tiles.paint(rect, draw)
+                self.changed(rect)
                 self.save_state()
 
         else:
             self.save_state()
 
         self.last_x, self.last_y = None, None
-        self.temp_end_point = None
-        self.update()
+        if self.preview is not None:
+            self.update_area(self.preview.bounds)
+            self.preview = None
+
+
+class FilterDialog(QDialog):
+    """Параметры фильтра с предпросмотром на уменьшенной копии изображения."""
+
+    def __init__(self, filter, image, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(filter.title)
+        self.filter = filter
+        self.proxy, self.scale = preview_proxy(image)
+        self.sliders = {}
+
+        form = QFormLayout()
+        for param in filter.params:
+            slider = QSlider(Qt.Orientation.Horizontal)
+            slider.setRange(param.minimum, param.maximum)
+            slider.setValue(param.default)
+            slider.valueChanged.connect(self.update_preview)
+            self.sliders[param.name] = slider
+            form.addRow(param.label, slider)
+        self.preview = QLabel()
+        self.preview.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.preview)
+        layout.addLayout(form)
+        layout.addWidget(buttons)
+        self.update_preview()
+
+    def params(self):
+        return {name: slider.value() for name, slider in self.sliders.items()}
+
+    def update_preview(self):
+        # Копия маленькая, поэтому фильтруется прямо здесь, в потоке GUI
+        result = self.filter.apply(self.proxy, self.params(), self.scale)
+        self.preview.setPixmap(QPixmap.fromImage(result))
 
 
 class MainWindow(QMainWindow):
@@ -244,27 +573,48 @@ class MainWindow(QMainWindow):
         main_menu = self.menuBar()
         file_menu = main_menu.addMenu("File")
 
-        new_img_action = QAction(QIcon('icons/new-image.png'), 'New', self)
-        open_action = QAction(QIcon('icons/open-image.png'), 'Open', self)
-        save_action = QAction(QIcon('icons/save-image.png'), 'Save', self)
+        new_img_action = QAction(icon('new-image'), 'New', self)
+        open_action = QAction(icon('open-image'), 'Open', self)
+        save_action = QAction(icon('save-image'), 'Save', self)
+        save_as_action = QAction('Save As…', self)
 
         file_menu.addAction(new_img_action)
         file_menu.addAction(open_action)
         file_menu.addAction(save_action)
-        self.setFixedSize(QSize(400, 300))
+        file_menu.addAction(save_as_action)
 
         new_img_action.triggered.connect(self.new_img)
         open_action.triggered.connect(self.open_file)
         save_action.triggered.connect(self.save_img)
+        save_as_action.triggered.connect(self.save_img_as)
+
+        # Меню "Filters"
+        filter_menu = main_menu.addMenu("Filters")
+        for f in FILTERS:
+            action = QAction(f.title, self)
+            action.triggered.connect(lambda checked, f=f: self.run_filter(f))
+            filter_menu.addAction(action)
+        self.filter_runner = None
 
         self.canvas = Canvas(self)
+        # Большие изображения открываются в исходном размере и прокручиваются
+        self.scroll = QScrollArea()
+        self.scroll.setWidget(self.canvas)
         w = QWidget()
         l = QVBoxLayout()
         w.setLayout(l)
-        l.addWidget(self.canvas)
+        l.addWidget(self.scroll)
         self.setCentralWidget(w)
 
-        self.setFixedSize(QSize(800, 600))
+        self.resize(QSize(800, 600))
+        # Текущая фоновая загрузка изображения
+        self.loader = None
+        # Сохранение идёт в фоне; save_path — файл, в который пишет Ctrl+S
+        self.saver = ImageSaver(self)
+        self.saver.failed.connect(self.image_save_failed)
+        self.save_path = None
+        # Открытый файл проекта: из него лениво читаются плитки
+        self.project = None
         self.current_color = "#000000"
 
         palette = QHBoxLayout()
@@ -277,11 +627,11 @@ class MainWindow(QMainWindow):
         # Панели инструментов
         self.toolbar = self.addToolBar("Tools")
 
-        self.undo_action = QAction(QIcon("icons/left.png"), "Undo", self)
+        self.undo_action = QAction(icon('left'), "Undo", self)
         self.undo_action.triggered.connect(self.canvas.undo)
         self.toolbar.addAction(self.undo_action)
 
-        self.redo_action = QAction(QIcon("icons/right.png"), "Redo", self)
+        self.redo_action = QAction(icon('right'), "Redo", self)
         self.redo_action.triggered.connect(self.canvas.redo)
         self.toolbar.addAction(self.redo_action)
 
@@ -291,6 +641,18 @@ class MainWindow(QMainWindow):
         undo_shortcut.activated.connect(self.canvas.undo)
         redo_shortcut.activated.connect(self.canvas.redo)
 
+        delete_shortcut = QShortcut(QKeySequence(QKeySequence.StandardKey.Delete), self)
+        delete_shortcut.activated.connect(self.canvas.delete_selection)
+        deselect_shortcut = QShortcut(QKeySequence("Ctrl+D"), self)
+        deselect_shortcut.activated.connect(lambda: self.canvas.set_area(None))
+
+        zoom_in_shortcut = QShortcut(QKeySequence("Ctrl+="), self)
+        zoom_out_shortcut = QShortcut(QKeySequence("Ctrl+-"), self)
+        zoom_reset_shortcut = QShortcut(QKeySequence("Ctrl+0"), self)
+        zoom_in_shortcut.activated.connect(lambda: self.canvas.set_zoom(self.canvas.zoom * ZOOM_STEP))
+        zoom_out_shortcut.activated.connect(lambda: self.canvas.set_zoom(self.canvas.zoom / ZOOM_STEP))
+        zoom_reset_shortcut.activated.connect(lambda: self.canvas.set_zoom(1.0))
+
         self.fileToolbar = QToolBar(self)
         self.fileToolbar.setIconSize(QSize(16, 16))
         self.fileToolbar.setObjectName('fileToolBar')
@@ -307,7 +669,7 @@ class MainWindow(QMainWindow):
 
         # Ползунок для изменения размера текста
         sizeicon = QLabel()
-        sizeicon.setPixmap(QPixmap("icons/border-weight.png"))
+        sizeicon.setPixmap(icon('border-weight').pixmap(16, 16))
         self.sliderToolbar.addWidget(sizeicon)
 
         self.sizeselect = QSlider()
@@ -318,29 +680,38 @@ class MainWindow(QMainWindow):
 
         # Кнопки для рисования
         self.brushButton = QPushButton()
-        self.brushButton.setIcon(QIcon('icons/paint-brush.png'))
+        self.brushButton.setIcon(icon('paint-brush'))
         self.brushButton.setCheckable(True)
         self.drawingToolbar.addWidget(self.brushButton)
 
         self.canButton = QPushButton()
-        self.canButton.setIcon(QIcon('icons/paint-can.png'))
+        self.canButton.setIcon(icon('paint-can'))
         self.canButton.setCheckable(True)
         self.drawingToolbar.addWidget(self.canButton)
 
         self.eraserButton = QPushButton()
-        self.eraserButton.setIcon(QIcon('icons/eraser.png'))
+        self.eraserButton.setIcon(icon('eraser'))
         self.eraserButton.setCheckable(True)
         self.drawingToolbar.addWidget(self.eraserButton)
 
         self.pickerButton = QPushButton()
-        self.pickerButton.setIcon(QIcon('icons/pipette.png'))
+        self.pickerButton.setIcon(icon('pipette'))
         self.pickerButton.setCheckable(True)
         self.drawingToolbar.addWidget(self.pickerButton)
         self.pickerButton.clicked.connect(self.picker_pressed)
 
-        self.fontComboBox = QtWidgets.QFontComboBox()
+        self.pickerSizeComboBox = QComboBox()
+        self.pickerSizeComboBox.addItems(["1x1", "3x3", "5x5"])
+        self.pickerSizeComboBox.currentIndexChanged.connect(self.change_picker_size)
+        self.drawingToolbar.addWidget(self.pickerSizeComboBox)
+
+        # Перебор всех установленных шрифтов дорог, поэтому до первого
+        # выбора инструмента «Текст» в списке только шрифт по умолчанию
+        self.fontComboBox = QComboBox()
         self.fontComboBox.setFixedWidth(150)
+        self.fontComboBox.addItem(QFont().family())
         self.drawingToolbar.addWidget(self.fontComboBox)
+        self.fonts_loaded = False
 
         self.fontSizeComboBox = QtWidgets.QComboBox()
         self.fontSizeComboBox.setFixedWidth(50)
@@ -350,7 +721,7 @@ class MainWindow(QMainWindow):
 
 
         self.textButton = QPushButton()
-        self.textButton.setIcon(QIcon('icons/text.png'))
+        self.textButton.setIcon(icon('text'))
         self.textButton.setCheckable(True)
         self.drawingToolbar.addWidget(self.textButton)
 
@@ -358,37 +729,57 @@ class MainWindow(QMainWindow):
 
         # ---Выпадающий список фигур---
         self.shapeComboBox = QComboBox()
-        self.shapeComboBox.addItem(QIcon("icons/none.png"), "Нет")
-        self.shapeComboBox.addItem(QIcon("icons/square.png"), "Квадрат")
-        self.shapeComboBox.addItem(QIcon("icons/circle.png"), "Круг")
-        self.shapeComboBox.addItem(QIcon("icons/line.png"), "Линия")
-        self.shapeComboBox.addItem(QIcon("icons/arrow.png"), "Стрелка")
+        self.shapeComboBox.addItem(icon('none'), "Нет")
+        self.shapeComboBox.addItem(icon('square'), "Квадрат")
+        self.shapeComboBox.addItem(icon('circle'), "Круг")
+        self.shapeComboBox.addItem(icon('line'), "Линия")
+        self.shapeComboBox.addItem(icon('arrow'), "Стрелка")
+        self.shapeComboBox.addItem("Выбор")
 
         self.drawingToolbar.addWidget(self.shapeComboBox)
 
         # Подключаем обработку выбора
         self.shapeComboBox.currentIndexChanged.connect(self.shape_selected)
 
+        # Инструменты выделения
+        self.selectionComboBox = QComboBox()
+        self.selectionComboBox.addItem("Выделение")
+        self.selectionComboBox.addItem("Прямоугольник")
+        self.selectionComboBox.addItem("Лассо")
+        self.selectionComboBox.addItem("Волшебная палочка")
+        self.drawingToolbar.addWidget(self.selectionComboBox)
+        self.selectionComboBox.currentIndexChanged.connect(self.selection_tool_selected)
+
         # Кнопки управления файлами
         self.newFileButton = QPushButton()
-        self.newFileButton.setIcon(QIcon('icons/new-image.png'))
+        self.newFileButton.setIcon(icon('new-image'))
         self.fileToolbar.addWidget(self.newFileButton)
         new_shortcut = QShortcut(QKeySequence("Ctrl+N"), self)
 
         self.openFileButton = QPushButton()
-        self.openFileButton.setIcon(QIcon('icons/open-image.png'))
+        self.openFileButton.setIcon(icon('open-image'))
         self.fileToolbar.addWidget(self.openFileButton)
         open_shortcut = QShortcut(QKeySequence("Ctrl+O"), self)
 
         self.saveFileButton = QPushButton()
-        self.saveFileButton.setIcon(QIcon('icons/save-image.png'))
+        self.saveFileButton.setIcon(icon('save-image'))
         self.fileToolbar.addWidget(self.saveFileButton)
         save_shortcut = QShortcut(QKeySequence("Ctrl+S"), self)
+        save_as_shortcut = QShortcut(QKeySequence("Ctrl+Shift+S"), self)
 
         self.copyFileButton = QPushButton()
-        self.copyFileButton.setIcon(QIcon('icons/copy-image.png'))
+        self.copyFileButton.setIcon(icon('copy-image'))
         self.fileToolbar.addWidget(self.copyFileButton)
 
+        # Сжатие PNG: скорость сохранения против размера файла
+        self.compressionComboBox = QComboBox()
+        self.compressionComboBox.addItem("PNG: быстро", 1)
+        self.compressionComboBox.addItem("PNG: обычно", DEFAULT_COMPRESSION)
+        self.compressionComboBox.addItem("PNG: компактно", 9)
+        self.compressionComboBox.setCurrentIndex(1)
+        self.compressionComboBox.currentIndexChanged.connect(self.change_compression)
+        self.fileToolbar.addWidget(self.compressionComboBox)
+
         self.openFileButton.clicked.connect(self.open_file)
         self.newFileButton.clicked.connect(self.new_img)
         self.saveFileButton.clicked.connect(self.save_img)
@@ -399,6 +790,7 @@ class MainWindow(QMainWindow):
         self.eraserButton.clicked.connect(self.eraser_pressed)
 
         save_shortcut.activated.connect(self.save_img)
+        save_as_shortcut.activated.connect(self.save_img_as)
         open_shortcut.activated.connect(self.open_file)
         new_shortcut.activated.connect(self.new_img)
 
@@ -406,6 +798,139 @@ class MainWindow(QMainWindow):
         self.all_buttons.append(self.pickerButton)
         self.all_buttons.append(self.textButton)
 
+        # Панель слоёв: сверху — верхний слой
+        self.layerList = QListWidget()
+        self.layerList.currentRowChanged.connect(self.layer_selected)
+        self.layerList.itemChanged.connect(self.layer_item_changed)
+        layer_buttons = QHBoxLayout()
+        for text, slot in (("+", self.add_layer), ("−", self.remove_layer),
+                           ("▲", self.raise_layer), ("▼", self.lower_layer)):
+            button = QPushButton(text)
+            button.setFixedWidth(30)
+            button.clicked.connect(slot)
+            layer_buttons.addWidget(button)
+        self.opacitySlider = QSlider(Qt.Orientation.Horizontal)
+        self.opacitySlider.setRange(0, 100)
+        self.opacitySlider.valueChanged.connect(self.change_layer_opacity)
+        self.opacitySlider.sliderReleased.connect(self.canvas.save_state)
+        self.blendComboBox = QComboBox()
+        self.blendComboBox.addItems(list(BLEND_MODES))
+        self.blendComboBox.currentIndexChanged.connect(self.change_layer_blend)
+        layers_widget = QWidget()
+        layers_layout = QVBoxLayout(layers_widget)
+        layers_layout.addWidget(self.layerList)
+        layers_layout.addLayout(layer_buttons)
+        layers_layout.addWidget(QLabel("Непрозрачность"))
+        layers_layout.addWidget(self.opacitySlider)
+        layers_layout.addWidget(QLabel("Наложение"))
+        layers_layout.addWidget(self.blendComboBox)
+        layers_dock = QDockWidget("Слои", self)
+        layers_dock.setWidget(layers_widget)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, layers_dock)
+        self.refresh_layers()
+
+        # Журнал автосохранения: после сбоя предлагаем вернуть потерянную работу
+        self.journal = Journal(parent=self)
+        self.journal.failed.connect(lambda error: print(f"❌ Автосохранение не удалось: {error}"))
+        if self.journal.acquire():
+            try:
+                recovered = self.journal.recover()
+            except Exception as e:
+                print(f"❌ Данные восстановления повреждены и удалены: {e}")
+                self.journal.discard()
+                recovered = None
+            if recovered is not None and QMessageBox.question(
+                    self, "Восстановление", "Прошлая сессия завершилась аварийно. Восстановить изображение?"
+            ) == QMessageBox.StandardButton.Yes:
+                self.canvas.set_document(recovered)
+            # Новая сессия начинается только после ответа: до него данные
+            # упавшей сессии остаются на диске
+            self.journal.start(self.canvas.doc)
+            self.canvas.history.journal = self.journal
+        else:
+            print("⚠ Автосохранение отключено: уже запущен другой экземпляр")
+
+
+    def refresh_layers(self):
+        # Перестраивает панель слоёв по документу холста
+        doc = self.canvas.doc
+        self.layerList.blockSignals(True)
+        self.layerList.clear()
+        for layer in reversed(doc.layers):
+            item = QListWidgetItem(layer.name)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable | Qt.ItemFlag.ItemIsEditable)
+            item.setCheckState(Qt.CheckState.Checked if layer.visible else Qt.CheckState.Unchecked)
+            self.layerList.addItem(item)
+        self.layerList.setCurrentRow(self.layer_row(doc.active))
+        self.layerList.blockSignals(False)
+        self.show_layer_props()
+
+    def show_layer_props(self):
+        layer = self.canvas.doc.layer()
+        self.opacitySlider.blockSignals(True)
+        self.opacitySlider.setValue(round(layer.opacity * 100))
+        self.opacitySlider.blockSignals(False)
+        self.blendComboBox.blockSignals(True)
+        self.blendComboBox.setCurrentIndex(list(BLEND_MODES.values()).index(layer.blend))
+        self.blendComboBox.blockSignals(False)
+
+    def layer_row(self, index):
+        # Строка списка <-> номер слоя (в документе слои идут снизу вверх)
+        return len(self.canvas.doc.layers) - 1 - index
+
+    def layers_edited(self):
+        # Состав или свойства слоёв изменились: один шаг истории и перерисовка
+        self.canvas.end_stroke()
+        self.canvas.changed()
+        self.canvas.save_state()
+        self.refresh_layers()
+
+    def add_layer(self):
+        self.canvas.end_stroke()
+        self.canvas.doc.add_layer()
+        self.layers_edited()
+
+    def remove_layer(self):
+        self.canvas.end_stroke()
+        self.canvas.doc.remove_layer(self.canvas.doc.active)
+        self.layers_edited()
+
+    def raise_layer(self):
+        doc = self.canvas.doc
+        doc.move_layer(doc.active, doc.active + 1)
+        self.layers_edited()
+
+    def lower_layer(self):
+        doc = self.canvas.doc
+        doc.move_layer(doc.active, doc.active - 1)
+        self.layers_edited()
+
+    def layer_selected(self, row):
+        if row < 0:
+            return
+        self.canvas.end_stroke()
+        self.canvas.doc.active = self.layer_row(row)
+        self.show_layer_props()
+
+    def layer_item_changed(self, item):
+        index = self.layer_row(self.layerList.row(item))
+        self.canvas.doc.set_layer_props(index, name=item.text(),
+                                        visible=item.checkState() == Qt.CheckState.Checked)
+        # Список не перестраиваем: сигнал пришёл от его же элемента
+        self.canvas.changed()
+        self.canvas.save_state()
+
+    def change_layer_opacity(self, value):
+        # Пока ползунок тянут, шаг истории копится; фиксируется при отпускании
+        doc = self.canvas.doc
+        doc.set_layer_props(doc.active, opacity=value / 100)
+        self.canvas.changed()
+
+    def change_layer_blend(self, index):
+        doc = self.canvas.doc
+        doc.set_layer_props(doc.active, blend=list(BLEND_MODES.values())[index])
+        self.layers_edited()
+
     def set_current_color(self, c):
         self.current_color = c
 
@@ -425,6 +950,9 @@ class MainWindow(QMainWindow):
     def change_pen_size(self, s):
         self.canvas.pen_size = s
 
+    def change_picker_size(self, index):
+        self.canvas.picker_size = 2 * index + 1
+
     def change_color(self, color):
         color_effect = QGraphicsColorizeEffect()
         color_effect.setColor(QColor(color))
@@ -432,36 +960,142 @@ class MainWindow(QMainWindow):
 
     def new_img(self):
         self.canvas.clear()
+        self.detach_file()
+
+    def detach_file(self):
+        # Новый документ не связан с прежним файлом: Ctrl+S снова спросит
+        # путь. Проект не закрывается — история отмены ещё может читать
+        # из него плитки
+        self.save_path = None
+        self.project = None
 
     def open_file(self):
-        path, _ = QFileDialog.getOpenFileName(self, 'Open file', "", "PNG images files (*.png); JPEG image files (*jpg); All files (*.*)")
-        if path:
-            pixmap = QPixmap()
-            pixmap.load(path)
-
-            iw, ih = pixmap.width(), pixmap.height()
-
-            cw, ch = 800, 500
-
-            if iw / cw < ih / ch:
-                pixmap = pixmap.scaledToWidth(cw)
-                hoff = (pixmap.height() - ch) // 2
-                pixmap = pixmap.copy(
-                    QRect(QPoint(0, hoff), QPoint(cw, pixmap.height() - hoff))
-                )
-            elif iw / cw > ih / ch:
-                pixmap = pixmap.scaledToHeight(ch)
-                woff = (pixmap.width() - cw) // 2
-                pixmap = pixmap.copy(
-                    QRect(QPoint(woff, 0), QPoint(pixmap.width() - woff, ch))
-                )
-            self.canvas.setPixmap(pixmap)
+        path, _ = QFileDialog.getOpenFileName(self, 'Open file', "", "PNG images files (*.png);;JPEG image files (*.jpg);;Picasso project (*.picasso);;All files (*.*)")
+        if path.endswith(PROJECT_EXT):
+            self.open_project(path)
+        elif path:
+            self.load_image(path)
+
+    def open_project(self, path):
+        try:
+            project, doc, undo, redo = Project.open(path)
+        except (OSError, ValueError) as e:
+            print(f"❌ Не удалось открыть проект: {e}")
+            return
+        self.canvas.set_project(doc, undo, redo)
+        if self.project is not None:
+            self.project.close()
+        self.project = project
+        self.save_path = path
+
+    def load_image(self, path):
+        # Декодирование идёт в пуле потоков, окно остаётся отзывчивым
+        if self.loader is not None:
+            self.loader.cancel()
+        loader = self.loader = ImageLoader(path, parent=self)
+
+        progress = QProgressDialog(f"Открытие {os.path.basename(path)}…", "Отмена", 0, 100, self)
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(300)
+        progress.canceled.connect(loader.cancel)
+        loader.progress.connect(progress.setValue)
+
+        def loaded(tiles):
+            if loader is self.loader:
+                self.canvas.set_document(Document.from_tiles(tiles))
+                self.detach_file()
+
+        def finished():
+            progress.reset()
+            progress.deleteLater()
+            if loader is self.loader:
+                self.loader = None
+            loader.deleteLater()
+
+        loader.loaded.connect(loaded)
+        loader.failed.connect(lambda error: print(f"❌ Не удалось открыть изображение: {error}"))
+        loader.finished.connect(finished)
+        loader.start()
+
+    def run_filter(self, f):
+        # Фильтр применяется к активному слою, а при выделении — только
+        # к нему; в историю попадают лишь плитки изменённой области
+        if not filters.HAVE_NUMPY:
+            QMessageBox.warning(self, "Фильтры", "Для фильтров нужен NumPy (pip install numpy)")
+            return
+        if self.filter_runner is not None:
+            return
+        canvas = self.canvas
+        canvas.end_stroke()
+        tiles, area = canvas.raster_tiles(), canvas.selected_area
+        if tiles is None:
+            return
+        rect = tiles.rect() if area is None else area.bounds
+        image = tiles.copy(rect)
+        params = {}
+        if f.params:
+            dialog = FilterDialog(f, image, self)
+            if dialog.exec() != QDialog.DialogCode.Accepted:
+                return
+            params = dialog.params()
+
+        runner = self.filter_runner = FilterRunner(f, image, params, parent=self)
+        progress = QProgressDialog(f"{f.title}…", "Отмена", 0, 100, self)
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(300)
+        progress.canceled.connect(runner.cancel)
+        runner.progress.connect(progress.setValue)
+
+        def done(result):
+            if area is None:
+                tiles.write(result, rect.topLeft())
+            else:
+                area.apply(tiles, result, rect.topLeft())
+            canvas.changed(rect)
+            canvas.save_state()
+
+        def finished():
+            progress.reset()
+            progress.deleteLater()
+            self.filter_runner = None
+            runner.deleteLater()
+
+        runner.done.connect(done)
+        runner.failed.connect(lambda error: print(f"❌ Фильтр не применился: {error}"))
+        runner.finished.connect(finished)
+        runner.start()
 
     def save_img(self):
-        path, _ = QFileDialog.getSaveFileName(self, "Save file", "", "PNG Image file (*.png)")
+        # Первый раз спрашиваем путь, дальше Ctrl+S пишет в тот же файл
+        if self.save_path is None:
+            self.save_img_as()
+        else:
+            self.save_to(self.save_path)
+
+    def save_img_as(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save file", "",
+                                              "PNG Image file (*.png);;Picasso project (*.picasso)")
         if path:
-            pixmap = self.canvas.pixmap()
-            pixmap.save(path, "PNG")
+            self.save_to(path)
+
+    def save_to(self, path):
+        self.save_path = path
+        # Снимок не должен попасть на середину открытого штриха
+        self.canvas.end_stroke()
+        if path.endswith(PROJECT_EXT):
+            # Проект хранит и историю; в уже сохранённый файл
+            # дописываются только изменившиеся плитки
+            if self.project is None:
+                self.project = Project()
+            self.saver.submit(self.project.save_job(path, self.canvas.doc, self.canvas.history))
+        else:
+            self.saver.save(self.canvas.doc, path)
+
+    def image_save_failed(self, error):
+        print(f"❌ Не удалось сохранить изображение: {error}")
+
+    def change_compression(self, index):
+        self.saver.compression = self.compressionComboBox.itemData(index)
 
     def can_pressed(self):
         self.release_buttons(self.canButton)
@@ -480,28 +1114,61 @@ class MainWindow(QMainWindow):
         self.canvas.set_pen_color(QColor("#FFFFFF"))
 
     def copy_to_clipboard(self):
+        # С выделением копируется только оно, с прозрачностью вне маски
         clipboard = QApplication.clipboard()
-        clipboard.setPixmap(self.canvas.pixmap())
+        area = self.canvas.selected_area
+        if area is None:
+            clipboard.setImage(self.canvas.doc.to_image())
+        else:
+            clipboard.setImage(area.cut(self.canvas.doc.copy(area.bounds)))
 
     def picker_pressed(self):
         self.release_buttons(self.pickerButton)
         self.canvas.tool = "picker"
 
     def shape_selected(self, index):
-        shapes = ["none", "square", "circle", "line", "arrow"]
+        shapes = ["none", "square", "circle", "line", "arrow", "select"]
         selected_shape = shapes[index]
         self.canvas.tool = selected_shape
         self.release_buttons(None)
         print(f"Выбрана фигура: {selected_shape}")
 
+    def selection_tool_selected(self, index):
+        tools = ["none"] + SELECT_TOOLS
+        self.canvas.tool = tools[index]
+        self.release_buttons(None)
+        print(f"Выбран инструмент выделения: {tools[index]}")
+
     def text_pressed(self):
         self.release_buttons(self.textButton)
         self.canvas.tool = "text"
+        self.load_fonts()
 
-
-app = QApplication(sys.argv)
-app.setWindowIcon(QIcon('icons/pallete.png'))
-window = MainWindow()
-window.show()
-
-app.exec()
+    def load_fonts(self):
+        if self.fonts_loaded:
+            return
+        self.fonts_loaded = True
+        current = self.fontComboBox.currentText()
+        self.fontComboBox.clear()
+        self.fontComboBox.addItems(families())
+        self.fontComboBox.setCurrentText(current)
+
+    def closeEvent(self, e):
+        # Штатное закрытие: журнал для восстановления больше не нужен
+        self.canvas.end_stroke()
+        self.journal.close()
+        self.canvas.history.close()
+        if self.project is not None:
+            self.project.close()
+        super().closeEvent(e)
+
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv)
+    app.setWindowIcon(icon('pallete'))
+    window = MainWindow()
+    startup.mark("окно")
+    startup.watch_first_paint(window.canvas)
+    window.show()
+
+    app.exec()
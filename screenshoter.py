@@ -1,25 +1,187 @@
+"""Скриншоты сайтов через Firefox без окна.
+
+Без аргументов — диалог: домен за доменом. В пакетном режиме список
+адресов (по одному в строке, # — комментарий) читается из файла или
+из stdin ("-"), а страницы снимаются параллельно пулом из N сеансов
+браузера, которые запускаются один раз и переиспользуются:
+
+    python screenshoter.py --batch domains.txt --workers 8 --timeout 20
+    python screenshoter.py --batch - --scheme http < pages.txt
+
+Строка может быть полным адресом (http://127.0.0.1:8000/page) —
+так пакетный режим проверяется на локальном HTTP-сервере.
+"""
+
+import argparse
+import hashlib
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.firefox.options import Options
 from PIL import Image
-import os
+
+# Сколько секунд ждать загрузки страницы
+PAGE_TIMEOUT = 30
+# Повторные попытки для страницы, которую не удалось снять
+RETRIES = 2
+WORKERS = 4
 
 
-def take_screenshot(domain, screenshot_dir='screenshots'):
+def make_driver(page_timeout=PAGE_TIMEOUT):
     options = Options()
-    options.headless = True
+    options.add_argument('-headless')
     driver = webdriver.Firefox(options=options)
-    screenshot_path = f"{screenshot_dir}/{domain.replace('/', '_')}.png"
+    driver.set_page_load_timeout(page_timeout)
+    return driver
+
+
+def page_url(target, scheme='https'):
+    # Полный адрес берётся как есть, к домену добавляется схема
+    return target if '://' in target else f'{scheme}://{target}'
+
+
+def screenshot_name(url):
+    # Имя файла из адреса: без схемы, недопустимые символы — в "_".
+    # Так разные адреса (http и https, a/b и a_b) дают одно имя,
+    # поэтому в конце — короткий хеш полного адреса
+    name = re.sub(r'[^\w.-]', '_', url.split('://', 1)[-1])
+    return f"{name}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}.png"
+
+
+def take_screenshot(domain, screenshot_dir='screenshots', driver=None):
+    url = page_url(domain)
+    screenshot_path = os.path.join(screenshot_dir, screenshot_name(url))
+    own = driver is None
     try:
-        driver.get(f'https://{domain}')
+        if own:
+            driver = make_driver()
+        driver.get(url)
         success = driver.save_screenshot(screenshot_path)
     except Exception as e:
         print(f'Произошла ошибка при создании скриншота: {e}')
         success = False
     finally:
-        driver.quit()
+        if own and driver is not None:
+            driver.quit()
     return success, screenshot_path
 
 
+class BrowserPool:
+    """size сеансов браузера на все потоки.
+
+    Сеанс запускается при первой выдаче и потом переиспользуется;
+    сломанный сеанс закрывается, а на его место при следующей выдаче
+    запускается новый.
+    """
+
+    def __init__(self, size, page_timeout=PAGE_TIMEOUT):
+        self.size = size
+        self.page_timeout = page_timeout
+        # None в очереди — свободное место без запущенного браузера
+        self.free = queue.Queue()
+        for _ in range(size):
+            self.free.put(None)
+        self.lock = threading.Lock()
+        self.drivers = set()
+
+    def acquire(self):
+        driver = self.free.get()
+        if driver is None:
+            try:
+                driver = make_driver(self.page_timeout)
+            except BaseException:
+                self.free.put(None)
+                raise
+            with self.lock:
+                self.drivers.add(driver)
+        return driver
+
+    def release(self, driver, broken=False):
+        if broken:
+            self._quit(driver)
+            driver = None
+        self.free.put(driver)
+
+    def _quit(self, driver):
+        with self.lock:
+            self.drivers.discard(driver)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    def close(self):
+        with self.lock:
+            drivers = list(self.drivers)
+        for driver in drivers:
+            self._quit(driver)
+
+
+def capture(pool, target, screenshot_dir, scheme='https', retries=RETRIES):
+    """Снимает одну страницу, повторяя попытку при ошибке;
+    возвращает (адрес, путь, ошибка или None)."""
+    url = page_url(target, scheme)
+    path = os.path.join(screenshot_dir, screenshot_name(url))
+    error = None
+    for attempt in range(retries + 1):
+        driver = None
+        broken = False
+        try:
+            driver = pool.acquire()
+            driver.get(url)
+            if driver.save_screenshot(path):
+                return target, path, None
+            error = 'браузер не сохранил снимок'
+        except TimeoutException:
+            # Сеанс жив: следующая загрузка просто уйдёт с этой страницы
+            error = f'страница не загрузилась за {pool.page_timeout} с'
+        except WebDriverException as e:
+            error = e.msg or str(e)
+            broken = True
+        finally:
+            if driver is not None:
+                pool.release(driver, broken)
+    return target, path, error
+
+
+def read_targets(source):
+    # Адреса по одному в строке; пустые строки и комментарии пропускаются
+    if source == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(source, encoding='utf-8') as f:
+            lines = f.readlines()
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith('#')]
+
+
+def run_batch(targets, screenshot_dir, workers=WORKERS, page_timeout=PAGE_TIMEOUT,
+              retries=RETRIES, scheme='https'):
+    pool = BrowserPool(max(1, min(workers, len(targets))), page_timeout)
+    start = time.monotonic()
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            jobs = executor.map(lambda target: capture(pool, target, screenshot_dir, scheme, retries), targets)
+            for target, path, error in jobs:
+                if error is None:
+                    print(f'✅ {target} → {path}')
+                else:
+                    failed += 1
+                    print(f'❌ {target}: {error}', file=sys.stderr)
+    finally:
+        pool.close()
+    elapsed = time.monotonic() - start
+    print(f'Готово: {len(targets) - failed} из {len(targets)} за {elapsed:.1f} с')
+    return 1 if failed else 0
+
+
 def crop_screenshot(path):
     try:
         with Image.open(path) as img:
@@ -35,13 +197,25 @@ def crop_screenshot(path):
         print(f'Произошла ошибка при обрезке изображения: {e}')
 
 
-def main():
-    SCREENSHOTS_DIR = 'screenshots'
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Скриншоты сайтов")
+    parser.add_argument('--batch', metavar='ФАЙЛ', help="список адресов; '-' — читать из stdin")
+    parser.add_argument('--out', default='screenshots', help="каталог для скриншотов")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="число сеансов браузера")
+    parser.add_argument('--timeout', type=float, default=PAGE_TIMEOUT, help="ожидание загрузки страницы, с")
+    parser.add_argument('--retries', type=int, default=RETRIES, help="повторов для неудачной страницы")
+    parser.add_argument('--scheme', default='https', help="схема для адресов без неё")
+    args = parser.parse_args(argv)
 
+    SCREENSHOTS_DIR = args.out
 
     if not os.path.exists(SCREENSHOTS_DIR):
         os.makedirs(SCREENSHOTS_DIR)
 
+    if args.batch is not None:
+        return run_batch(read_targets(args.batch), SCREENSHOTS_DIR, args.workers,
+                         args.timeout, args.retries, args.scheme)
+
     while True:
         domain = input("Введите домен сайта (или 'exit' для выхода): ")
         if domain.lower() == 'exit':
@@ -56,4 +230,4 @@ def main():
             print('Не удалось сохранить скриншот')
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())